@@ -0,0 +1,134 @@
+"""
+Metadata index for the asset library.
+
+Each scan stats the videos in INPUT_DIR, reuses index entries whose size and
+mtime still match, and probes only new or changed files - one ffprobe each,
+run concurrently on a bounded thread pool. The index is persisted to
+LIBRARY_INDEX_FILE, so a warm listing is a directory walk and dict lookups.
+"""
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from config import INPUT_DIR, LIBRARY_INDEX_FILE, LIBRARY_SCAN_WORKERS
+from ffmpeg_utils import probe_metadata
+
+
+VIDEO_EXTENSIONS = {".mp4", ".mov", ".mkv", ".webm", ".avi", ".m4v"}
+_INDEX_VERSION = 1
+_NO_FFPROBE = object()
+
+_index = None
+_index_stamp = None  # (mtime_ns, size) of the index file when it was read
+_lock = threading.Lock()
+
+
+def _load_index():
+    """Return the cached index, re-reading it only if another process rewrote it"""
+    global _index, _index_stamp
+    try:
+        stat = os.stat(LIBRARY_INDEX_FILE)
+    except FileNotFoundError:
+        return _index or {}
+
+    stamp = (stat.st_mtime_ns, stat.st_size)
+    if _index is None or stamp != _index_stamp:
+        try:
+            with open(LIBRARY_INDEX_FILE) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            data = {}
+        _index = data.get("assets", {}) if data.get("version") == _INDEX_VERSION else {}
+        _index_stamp = stamp
+    return _index
+
+
+def _save_index(assets):
+    global _index, _index_stamp
+    os.makedirs(os.path.dirname(LIBRARY_INDEX_FILE), exist_ok=True)
+    temp_path = f"{LIBRARY_INDEX_FILE}.{os.getpid()}.tmp"
+    with open(temp_path, "w") as f:
+        json.dump({"version": _INDEX_VERSION, "assets": assets}, f)
+    os.replace(temp_path, LIBRARY_INDEX_FILE)
+
+    stat = os.stat(LIBRARY_INDEX_FILE)
+    _index = assets
+    _index_stamp = (stat.st_mtime_ns, stat.st_size)
+
+
+def _list_assets():
+    """Map file name -> stat for the videos in INPUT_DIR"""
+    try:
+        entries = os.scandir(INPUT_DIR)
+    except FileNotFoundError:
+        return {}
+
+    assets = {}
+    with entries:
+        for entry in entries:
+            # Skips upload sessions, .part files and keyframe sidecars
+            if entry.name.startswith(".") or not entry.is_file():
+                continue
+            if os.path.splitext(entry.name)[1].lower() in VIDEO_EXTENSIONS:
+                assets[entry.name] = entry.stat()
+    return assets
+
+
+def _probe(path):
+    try:
+        metadata = probe_metadata(path)
+    except FileNotFoundError:
+        return _NO_FFPROBE
+    return metadata
+
+
+def scan(force=False):
+    """
+    Return metadata for every asset, probing only files that changed.
+
+    Returns (assets, probed) where assets is a list of dicts sorted by name
+    and probed is the number of files that needed ffprobe. ``force``
+    re-probes everything.
+    """
+    with _lock:
+        index = _load_index()
+        files = _list_assets()
+
+        assets = {}
+        stale = []
+        for name, stat in files.items():
+            entry = index.get(name)
+            if (not force and entry and entry["size"] == stat.st_size
+                    and entry["mtime_ns"] == stat.st_mtime_ns):
+                assets[name] = entry
+            else:
+                stale.append((name, stat))
+
+        unindexed = {}
+        if stale:
+            workers = max(1, min(LIBRARY_SCAN_WORKERS, len(stale)))
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                results = pool.map(
+                    _probe, [os.path.join(INPUT_DIR, name) for name, _ in stale])
+                for (name, stat), metadata in zip(stale, results):
+                    entry = {"name": name, "size": stat.st_size,
+                             "mtime_ns": stat.st_mtime_ns}
+                    if metadata is _NO_FFPROBE:
+                        # Not the file's fault - list it but probe again next time
+                        unindexed[name] = dict(entry, error="ffprobe not found")
+                        continue
+                    if metadata is None:
+                        entry["error"] = "unreadable"
+                    else:
+                        entry.update(metadata)
+                    assets[name] = entry
+
+            if unindexed:
+                print("⚠️  FFprobe not found - asset metadata unavailable.")
+
+        if assets != index:
+            _save_index(assets)
+
+    listing = sorted({**assets, **unindexed}.values(), key=lambda a: a["name"])
+    return listing, len(stale)
@@ -0,0 +1,79 @@
+"""
+Compare processing backends on real clips.
+
+    python benchmark_backends.py short.mp4 long.mp4 --repeat 3
+
+For every clip and backend this times a few representative operations and
+prints the median wall time, so you can see where spawn/probe overhead (short
+clips) or raw encode throughput (long renders) dominates. Operations a
+backend cannot run (e.g. GPL filters missing from PyAV's bundled libav) are
+reported as n/a rather than timed on the fallback backend.
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+import ffmpeg_utils
+from ffmpeg_utils import (
+    SubprocessBackend, get_video_duration, ffmpeg_adjust_brightness,
+    ffmpeg_adjust_volume, ffmpeg_adjust_speed
+)
+
+
+OPERATIONS = [
+    ("brightness", lambda src, dst: ffmpeg_adjust_brightness(src, dst, 10)),
+    ("volume", lambda src, dst: ffmpeg_adjust_volume(src, dst, 3)),
+    ("speed", lambda src, dst: ffmpeg_adjust_speed(src, dst, 1.5)),
+]
+
+
+def _available_backends():
+    backends = [SubprocessBackend()]
+    try:
+        from pyav_backend import PyAVBackend
+        backends.append(PyAVBackend())  # No fallback: time libav only
+    except ImportError:
+        print("⚠️  PyAV not installed - benchmarking subprocess backend only")
+    return backends
+
+
+def benchmark(clips, repeat):
+    rows = []
+    with tempfile.TemporaryDirectory() as temp_dir:
+        output = os.path.join(temp_dir, "bench_output.mp4")
+        for clip in clips:
+            duration = get_video_duration(clip)
+            for backend in _available_backends():
+                ffmpeg_utils._backend = backend
+                for name, operation in OPERATIONS:
+                    timings = []
+                    try:
+                        for _ in range(repeat):
+                            start = time.perf_counter()
+                            operation(clip, output)
+                            timings.append(time.perf_counter() - start)
+                    except ValueError as e:
+                        print(f"⚠️  {backend.name} cannot run {name}: {e}")
+                    rows.append((os.path.basename(clip), duration, backend.name, name,
+                                 statistics.median(timings) if timings else None))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark FFmpeg backends")
+    parser.add_argument("clips", nargs="+", help="Video files to process")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="Runs per operation (median is reported)")
+    args = parser.parse_args()
+
+    print(f"{'clip':30} {'duration':>9} {'backend':>11} {'operation':>11} {'median s':>9}")
+    for clip, duration, backend, operation, seconds in benchmark(args.clips, args.repeat):
+        duration_label = f"{duration:.1f}s" if duration else "?"
+        seconds_label = f"{seconds:.3f}" if seconds is not None else "n/a"
+        print(f"{clip[:30]:30} {duration_label:>9} {backend:>11} {operation:>11} {seconds_label:>9}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Fold color actions into a single 3D LUT.
+
+brightness, adjust_contrast, saturation, gamma and hue are all per-pixel
+functions of the input color, so any sequence of them collapses into one
+lookup table. The table is evaluated with vectorized NumPy on an N^3 RGB
+grid, written as a .cube file cached by parameter hash, and applied with a
+single ``lut3d`` filter instead of one eq/hue transcode per action.
+"""
+import hashlib
+import json
+import os
+import threading
+
+import numpy as np
+
+from config import CACHE_DIR, COLOR_LUT_SIZE
+
+
+COLOR_ACTIONS = ("brightness", "adjust_contrast", "saturation", "gamma", "hue")
+LUT_DIR = os.path.join(CACHE_DIR, "luts")
+_LUT_VERSION = 1
+
+# BT.601 RGB <-> YUV, matching what eq/hue operate on
+_RGB_TO_YUV = np.array([
+    [0.299, 0.587, 0.114],
+    [-0.168736, -0.331264, 0.5],
+    [0.5, -0.418688, -0.081312],
+])
+_YUV_TO_RGB = np.linalg.inv(_RGB_TO_YUV)
+
+
+def _apply(yuv, action, value):
+    """Apply one action to an (n, 3) YUV array in place, mirroring ffmpeg_utils"""
+    y, uv = yuv[:, 0], yuv[:, 1:]
+    if action == "brightness":
+        y += value / 100.0
+    elif action == "adjust_contrast":
+        contrast = 1 + (value / 100.0)
+        y -= 0.5
+        y *= contrast
+        y += 0.5
+    elif action == "saturation":
+        uv *= 1 + (value / 100.0)
+    elif action == "gamma":
+        gamma = max(0.1, 1 + (value / 100.0))
+        np.clip(y, 0.0, 1.0, out=y)
+        np.power(y, 1.0 / gamma, out=y)
+    elif action == "hue":
+        angle = np.radians(value)
+        cos, sin = np.cos(angle), np.sin(angle)
+        u, v = uv[:, 0].copy(), uv[:, 1].copy()
+        uv[:, 0] = u * cos - v * sin
+        uv[:, 1] = u * sin + v * cos
+    else:
+        raise ValueError(f"Not a color action: {action}")
+
+
+def build_lut(actions, size=COLOR_LUT_SIZE):
+    """
+    Evaluate a sequence of color actions on an RGB grid.
+
+    Returns an (size**3, 3) array in .cube order: red varies fastest, then
+    green, then blue.
+    """
+    grid = np.linspace(0.0, 1.0, size)
+    blue, green, red = np.meshgrid(grid, grid, grid, indexing="ij")
+    rgb = np.stack([red, green, blue], axis=-1).reshape(-1, 3)
+
+    yuv = rgb @ _RGB_TO_YUV.T
+    for act in actions:
+        _apply(yuv, act.get("action"), float(act.get("value", 0)))
+        # Each separate pass wrote clipped 8-bit YUV; match that between steps
+        np.clip(yuv[:, 0], 0.0, 1.0, out=yuv[:, 0])
+        np.clip(yuv[:, 1:], -0.5, 0.5, out=yuv[:, 1:])
+
+    return np.clip(yuv @ _YUV_TO_RGB.T, 0.0, 1.0)
+
+
+def lut_key(actions, size=COLOR_LUT_SIZE):
+    params = [[act.get("action"), float(act.get("value", 0))] for act in actions]
+    payload = json.dumps({"v": _LUT_VERSION, "size": size, "actions": params})
+    return hashlib.sha256(payload.encode()).hexdigest()[:32]
+
+
+def get_lut_file(actions, size=COLOR_LUT_SIZE):
+    """Return the path of the cached .cube file for these actions, building it once"""
+    path = os.path.join(LUT_DIR, f"{lut_key(actions, size)}.cube")
+    if os.path.exists(path):
+        return path
+
+    table = build_lut(actions, size)
+    os.makedirs(LUT_DIR, exist_ok=True)
+    temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temp_path, "w") as f:
+        f.write(f"LUT_3D_SIZE {size}\n")
+        np.savetxt(f, table, fmt="%.6f")
+    os.replace(temp_path, path)
+    return path
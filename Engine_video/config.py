@@ -32,3 +32,77 @@ CORS_ORIGINS = os.getenv("CORS_ORIGINS", "*").split(",")
 # FFmpeg Configuration
 FFMPEG_TIMEOUT = int(os.getenv("FFMPEG_TIMEOUT", "300"))  # 5 minutes default
 FFMPEG_PATH = os.getenv("FFMPEG_PATH")
+
+# Render Cache Configuration
+CACHE_DIR = _resolve_dir("CACHE_DIR", "cache")
+RENDER_CACHE_ENABLED = os.getenv("RENDER_CACHE_ENABLED", "1") != "0"
+RENDER_CACHE_MAX_BYTES = int(
+    os.getenv("RENDER_CACHE_MAX_BYTES", str(2 * 1024 ** 3)))  # 2 GiB default
+
+# Adaptive Streaming Configuration
+STREAM_DIR = os.path.abspath(
+    os.getenv("STREAM_DIR", os.path.join(OUTPUT_DIR, "streams")))
+ABR_SEGMENT_SECONDS = int(os.getenv("ABR_SEGMENT_SECONDS", "4"))
+# Comma separated height:video_bitrate:audio_bitrate renditions, highest first
+ABR_LADDER = [
+    {"height": int(height), "video_bitrate": video_bitrate,
+     "audio_bitrate": audio_bitrate}
+    for height, video_bitrate, audio_bitrate in (
+        rung.split(":") for rung in os.getenv(
+            "ABR_LADDER",
+            "1080:5000k:192k,720:2800k:128k,480:1400k:128k,360:800k:96k"
+        ).split(",")
+    )
+]
+
+# Job Queue Configuration
+JOB_QUEUE_BACKEND = os.getenv("JOB_QUEUE_BACKEND", "sqlite")
+# Point at shared storage so API and worker nodes see the same queue
+JOB_DB_PATH = os.path.abspath(
+    os.getenv("JOB_DB_PATH", str(BASE_DIR / "jobs.sqlite3")))
+JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", "60"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+WORKER_POLL_INTERVAL = float(os.getenv("WORKER_POLL_INTERVAL", "1.0"))
+# "subprocess" spawns the ffmpeg CLI per step; "pyav" runs libav in-process
+FFMPEG_BACKEND = os.getenv("FFMPEG_BACKEND", "subprocess").lower()
+
+# Profiling Configuration
+PROFILE_DIR = _resolve_dir("PROFILE_DIR", "profiles")
+PROFILE_SAVE = os.getenv("PROFILE_SAVE", "0") != "0"
+
+# Resumable Upload Configuration
+UPLOAD_SESSION_DIR = os.path.abspath(
+    os.getenv("UPLOAD_SESSION_DIR", os.path.join(INPUT_DIR, ".sessions")))
+UPLOAD_MAX_CHUNK_BYTES = int(
+    os.getenv("UPLOAD_MAX_CHUNK_BYTES", str(64 * 1024 ** 2)))  # 64 MiB default
+# Sessions with no chunk activity for this long are removed with their .part file
+UPLOAD_SESSION_TTL_SECONDS = int(os.getenv("UPLOAD_SESSION_TTL_SECONDS", str(24 * 3600)))
+
+# Encoder Tuning Configuration
+ENCODER_TUNING_ENABLED = os.getenv("ENCODER_TUNING_ENABLED", "1") != "0"
+ENCODER_TUNING_FILE = os.path.abspath(
+    os.getenv("ENCODER_TUNING_FILE", os.path.join(CACHE_DIR, "encoder_tuning.json")))
+# Minimum SSIM against the synthetic source for a preset to be eligible
+ENCODER_TUNING_MIN_SSIM = float(os.getenv("ENCODER_TUNING_MIN_SSIM", "0.97"))
+# Largest output size, relative to the default preset's, a faster preset may produce
+ENCODER_TUNING_MAX_SIZE_RATIO = float(os.getenv("ENCODER_TUNING_MAX_SIZE_RATIO", "1.15"))
+
+# Color LUT Configuration
+# Consecutive color actions are folded into one 3D LUT pass when enabled
+COLOR_LUT_ENABLED = os.getenv("COLOR_LUT_ENABLED", "1") != "0"
+COLOR_LUT_SIZE = int(os.getenv("COLOR_LUT_SIZE", "33"))
+
+# Asset Library Configuration
+# Probed metadata is kept here and reused until a file's size or mtime changes
+LIBRARY_INDEX_FILE = os.path.abspath(
+    os.getenv("LIBRARY_INDEX_FILE", os.path.join(CACHE_DIR, "library_index.json")))
+LIBRARY_SCAN_WORKERS = int(
+    os.getenv("LIBRARY_SCAN_WORKERS", str(min(8, (os.cpu_count() or 1) * 2))))
+
+# Job Workspace Configuration
+# Per-job scratch space; keep it on the same filesystem as OUTPUT_DIR and
+# STREAM_DIR so finished renders are published with an atomic rename
+WORK_DIR = os.path.abspath(
+    os.getenv("WORK_DIR", os.path.join(OUTPUT_DIR, ".work")))
+# Workspaces of other hosts (or without a live owner) older than this are swept
+WORKSPACE_STALE_SECONDS = int(os.getenv("WORKSPACE_STALE_SECONDS", str(24 * 3600)))
@@ -0,0 +1,237 @@
+"""
+Calibration of encoder settings for this host.
+
+Workers calibrate before taking jobs (or run ``python worker.py --calibrate``
+once); the API only loads the cached result, so it never benchmarks while
+serving. Calibration lists the encoders and filters the FFmpeg build provides,
+encodes a short synthetic clip per resolution class with each candidate
+preset/thread setting, and keeps the fastest setting whose SSIM against the
+source meets ENCODER_TUNING_MIN_SSIM. Candidates are encoded at JOB_CRF, the
+rate control jobs use, and a faster preset only qualifies if its output is at
+most ENCODER_TUNING_MAX_SIZE_RATIO times the size of the default preset's -
+at equal CRF a faster preset keeps SSIM up by spending more bits. Results are
+cached in ENCODER_TUNING_FILE until the FFmpeg build or CPU count changes.
+"""
+import json
+import os
+import re
+import subprocess
+import tempfile
+import threading
+import time
+
+from config import (
+    ENCODER_TUNING_FILE, ENCODER_TUNING_MIN_SSIM, ENCODER_TUNING_MAX_SIZE_RATIO
+)
+
+
+# Preferred H.264 encoders, best first; the first one the build has is tuned
+H264_ENCODERS = ["libx264", "libopenh264", "h264_videotoolbox", "h264_nvenc", "h264_qsv"]
+X264_PRESETS = ["ultrafast", "superfast", "veryfast", "faster", "fast", "medium"]
+X264_DEFAULT_PRESET = "medium"
+JOB_CRF = "23"  # libx264's default, passed explicitly so jobs match the benchmark
+RESOLUTION_CLASSES = {
+    "sd": (854, 480),
+    "hd": (1280, 720),
+    "fhd": (1920, 1080),
+}
+SAMPLE_SECONDS = 2
+_TUNING_VERSION = 3
+
+_tuning = None
+_lock = threading.Lock()
+
+
+def _list_names(ffmpeg_bin, kind):
+    """Return the names listed by `ffmpeg -encoders` / `ffmpeg -filters`"""
+    result = subprocess.run(
+        [ffmpeg_bin, "-hide_banner", f"-{kind}"],
+        capture_output=True, text=True, check=True)
+    names = set()
+    for line in result.stdout.splitlines():
+        # " V....D libx264   libx264 H.264 ..." / " ... lut3d   V->V   Adjust ..."
+        match = re.match(r"^\s*[A-Z.|]{3,6}\s+(\S+)\s", line)
+        if match and match.group(1) != "=":
+            names.add(match.group(1))
+    return names
+
+
+def _ffmpeg_version(ffmpeg_bin):
+    result = subprocess.run(
+        [ffmpeg_bin, "-hide_banner", "-version"],
+        capture_output=True, text=True, check=True)
+    return result.stdout.splitlines()[0] if result.stdout else ""
+
+
+def _candidates(encoder):
+    cores = os.cpu_count() or 1
+    thread_options = sorted({0, cores, max(1, cores // 2)})
+    if encoder == "libx264":
+        return [["-preset", preset, "-crf", JOB_CRF, "-threads", str(threads)]
+                for preset in X264_PRESETS for threads in thread_options]
+    return [["-threads", str(threads)] for threads in thread_options]
+
+
+def _benchmark(ffmpeg_bin, encoder, args, size, work_dir):
+    """Encode the synthetic clip with a job's options; return (seconds, ssim, bytes)"""
+    width, height = size
+    source = f"testsrc2=size={width}x{height}:rate=30:duration={SAMPLE_SECONDS}"
+    encoded = os.path.join(work_dir, "sample.mp4")
+
+    start = time.perf_counter()
+    subprocess.run(
+        [ffmpeg_bin, "-y", "-hide_banner", "-f", "lavfi", "-i", source,
+         "-c:v", encoder, *args, "-pix_fmt", "yuv420p", encoded],
+        capture_output=True, check=True)
+    elapsed = time.perf_counter() - start
+    encoded_size = os.path.getsize(encoded)
+
+    result = subprocess.run(
+        [ffmpeg_bin, "-hide_banner", "-i", encoded, "-f", "lavfi", "-i", source,
+         "-lavfi", "ssim", "-f", "null", "-"],
+        capture_output=True, text=True, check=True)
+    match = re.search(r"All:([0-9.]+)", result.stderr)
+    return elapsed, float(match.group(1)) if match else 0.0, encoded_size
+
+
+def _pick(results):
+    """Fastest result within the SSIM target and the size budget"""
+    reference = [r for r in results if X264_DEFAULT_PRESET in r["args"]] or results
+    max_bytes = min(r["bytes"] for r in reference) * ENCODER_TUNING_MAX_SIZE_RATIO
+    eligible = [r for r in results
+                if r["ssim"] >= ENCODER_TUNING_MIN_SSIM and r["bytes"] <= max_bytes]
+    if eligible:
+        return min(eligible, key=lambda r: r["seconds"])
+    # Fall back to the best quality setting if none meet the target
+    return max(results, key=lambda r: r["ssim"], default=None)
+
+
+def _run_calibration(ffmpeg_bin, fingerprint):
+    encoders = _list_names(ffmpeg_bin, "encoders")
+    filters = _list_names(ffmpeg_bin, "filters")
+    encoder = next((e for e in H264_ENCODERS if e in encoders), None)
+
+    tuning = {
+        "version": _TUNING_VERSION,
+        "fingerprint": fingerprint,
+        "encoder": encoder or "libx264",
+        "encoders": sorted(encoders),
+        "filters": sorted(filters),
+        "classes": {}
+    }
+    if encoder is None:
+        print("⚠️  No H.264 encoder found in this FFmpeg build")
+        return tuning
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        for name, size in RESOLUTION_CLASSES.items():
+            results = []
+            for args in _candidates(encoder):
+                try:
+                    elapsed, ssim, encoded_size = _benchmark(
+                        ffmpeg_bin, encoder, args, size, work_dir)
+                except subprocess.CalledProcessError:
+                    continue  # Setting not supported by this build/host
+                results.append({"args": args, "seconds": elapsed, "ssim": ssim,
+                                "bytes": encoded_size})
+
+            best = _pick(results) if results else None
+            if best:
+                tuning["classes"][name] = best
+                print(f"🎛️  {name}: {' '.join(best['args'])} "
+                      f"({best['seconds']:.2f}s, SSIM {best['ssim']:.4f}, "
+                      f"{best['bytes'] // 1024} KiB)")
+
+    return tuning
+
+
+def calibrate(ffmpeg_bin, force=False, cached_only=False):
+    """
+    Load cached tuning for this host or run the benchmark and cache it.
+
+    With ``cached_only`` a missing or outdated cache is not rebuilt; the
+    default encoder settings stay in effect instead.
+    """
+    global _tuning
+    try:
+        fingerprint = {
+            "ffmpeg": os.path.realpath(ffmpeg_bin) if os.path.exists(ffmpeg_bin) else ffmpeg_bin,
+            "version": _ffmpeg_version(ffmpeg_bin),
+            "cpu_count": os.cpu_count(),
+            "min_ssim": ENCODER_TUNING_MIN_SSIM,
+            "max_size_ratio": ENCODER_TUNING_MAX_SIZE_RATIO,
+            "crf": JOB_CRF
+        }
+    except (subprocess.CalledProcessError, FileNotFoundError):
+        print("⚠️  FFmpeg not found - skipping encoder calibration")
+        return None
+
+    if not force:
+        try:
+            with open(ENCODER_TUNING_FILE) as f:
+                cached = json.load(f)
+            if cached.get("version") == _TUNING_VERSION and cached.get("fingerprint") == fingerprint:
+                _tuning = cached
+                return cached
+        except (OSError, ValueError):
+            pass
+
+    if cached_only:
+        print("⚠️  No encoder calibration for this host - using default settings "
+              "(run `python worker.py --calibrate`)")
+        return None
+
+    with _lock:
+        print("🎛️  Calibrating encoder settings for this host...")
+        tuning = _run_calibration(ffmpeg_bin, fingerprint)
+        os.makedirs(os.path.dirname(ENCODER_TUNING_FILE), exist_ok=True)
+        temp_path = f"{ENCODER_TUNING_FILE}.{os.getpid()}.tmp"
+        with open(temp_path, "w") as f:
+            json.dump(tuning, f, indent=2)
+        os.replace(temp_path, ENCODER_TUNING_FILE)
+        _tuning = tuning
+    return tuning
+
+
+def resolution_class(height):
+    """Smallest class at least as tall as the video, else the largest"""
+    for name, (_, class_height) in sorted(RESOLUTION_CLASSES.items(), key=lambda c: c[1][1]):
+        if height <= class_height:
+            return name
+    return max(RESOLUTION_CLASSES, key=lambda c: RESOLUTION_CLASSES[c][1])
+
+
+def settings():
+    """The tuned encoder and per-class options, e.g. to key cached renders on"""
+    if not _tuning:
+        return None
+    return {"encoder": _tuning["encoder"],
+            "classes": {name: c["args"] for name, c in _tuning["classes"].items()}}
+
+
+def video_encoder():
+    return _tuning["encoder"] if _tuning else "libx264"
+
+
+def needs_resolution():
+    """False when every class uses the same settings, so callers can skip probing"""
+    if not _tuning or not _tuning["classes"]:
+        return False
+    settings = {tuple(c["args"]) for c in _tuning["classes"].values()}
+    return len(settings) > 1
+
+
+def encoder_args(height=None):
+    """Tuned encoder options for a video of the given height"""
+    if not _tuning or not _tuning["classes"]:
+        return []
+    classes = _tuning["classes"]
+    name = resolution_class(height) if height else None
+    if name not in classes:
+        name = next(iter(classes))
+    return list(classes[name]["args"])
+
+
+def has_filter(name):
+    """Whether the FFmpeg build provides a filter (assumed True before calibration)"""
+    return name in _tuning["filters"] if _tuning else True
@@ -1,10 +1,16 @@
 import os
+import json
 import shutil
 import subprocess
 import re
+import tempfile
 from pathlib import Path
 
-from config import FFMPEG_PATH
+from config import FFMPEG_PATH, FFMPEG_BACKEND, INPUT_DIR
+from keyframe_index import ensure_index_async, load_index, probe_keyframe_after
+from profiler import current_profile, run_command
+import encoder_tuning
+from workspace import scratch_dir
 
 
 DEFAULT_FFMPEG_NAME = "ffmpeg.exe" if os.name == "nt" else "ffmpeg"
@@ -39,103 +45,145 @@ def _prepare_ffmpeg_cmd(cmd):
 
 
 def run_ffmpeg_command(cmd):
-    return subprocess.run(_prepare_ffmpeg_cmd(cmd), check=True, capture_output=True)
+    if current_profile() is not None:
+        # Have FFmpeg report its own utime/stime/maxrss alongside ours
+        cmd = [cmd[0], "-benchmark", *cmd[1:]]
+    return run_command(_prepare_ffmpeg_cmd(cmd))
 
 
-def safe_filename(name):
-    # Replace unsafe chars with underscore
-    return re.sub(r'[^a-zA-Z0-9_.-]', '_', name)
+class SubprocessBackend:
+    """Runs each operation as its own FFmpeg process (the default)"""
 
+    name = "subprocess"
 
-def ffmpeg_trim(input_path, output_path, seconds):
-    input_path = Path(input_path)
-    output_path = Path(output_path)
+    def transcode(self, input_path, output_path, video_filter=None, audio_filter=None):
+        """Apply a video and/or audio filter chain, copying untouched streams"""
+        cmd = ["ffmpeg", "-y", "-i", str(input_path)]
 
-    # Ensure destination directory exists
-    output_path.parent.mkdir(parents=True, exist_ok=True)
+        if video_filter:
+            cmd += ["-vf", video_filter,
+                    "-c:v", encoder_tuning.video_encoder(),
+                    *tuned_encoder_args(input_path)]
+        else:
+            cmd += ["-c:v", "copy"]
 
-    # Ensure old file removed
-    if output_path.exists():
-        output_path.unlink()
+        if audio_filter:
+            cmd += ["-af", audio_filter, "-c:a", "aac"]
+        else:
+            cmd += ["-c:a", "copy"]
 
-    cmd = [
-        "ffmpeg", "-y",
-        "-ss", str(seconds),
-        "-i", str(input_path),
-        "-c", "copy",  # Copy both video and audio without re-encoding
-        str(output_path)
-    ]
-    try:
+        cmd.append(str(output_path))
         run_ffmpeg_command(cmd)
-    except subprocess.CalledProcessError as e:
-        print("FFmpeg error:", e.stderr.decode())
-        raise
-    except FileNotFoundError:
-        raise Exception(
-            "FFmpeg not found! Please install FFmpeg and add it to your system PATH.\nDownload from: https://ffmpeg.org/download.html")
 
-    return str(output_path)
 
+def tuned_encoder_args(input_path):
+    """Host-calibrated encoder options for the input's resolution class"""
+    height = None
+    if encoder_tuning.needs_resolution():
+        resolution = get_video_resolution(input_path)
+        height = resolution[1] if resolution else None
+    return encoder_tuning.encoder_args(height)
 
-def ffmpeg_adjust_contrast(input_path, output_path, value):
-    """Adjust video contrast using FFmpeg while preserving audio"""
-    input_path = Path(input_path)
+
+_backend = None
+
+
+def get_backend():
+    """Return the processing backend selected by FFMPEG_BACKEND"""
+    global _backend
+    if _backend is None:
+        if FFMPEG_BACKEND == "pyav":
+            # Optional dependency - only required when selected
+            from pyav_backend import PyAVBackend
+            _backend = PyAVBackend(fallback=SubprocessBackend())
+        elif FFMPEG_BACKEND == "subprocess":
+            _backend = SubprocessBackend()
+        else:
+            raise ValueError(f"Unknown FFmpeg backend: {FFMPEG_BACKEND}")
+    return _backend
+
+
+def _transcode(input_path, output_path, label, video_filter=None, audio_filter=None):
+    """Run a filter operation on the configured backend with shared error handling"""
     output_path = Path(output_path)
 
     # Ensure old file removed
     if output_path.exists():
         output_path.unlink()
 
-    # Convert value to contrast filter format (1.0 = normal, 0.5 = less contrast, 2.0 = more contrast)
-    contrast_factor = 1 + (value / 100.0)
-
-    cmd = [
-        "ffmpeg", "-y",
-        "-i", str(input_path),
-        "-vf", f"eq=contrast={contrast_factor}",  # Video filter for contrast
-        "-c:a", "copy",  # Copy audio without re-encoding
-        "-c:v", "libx264",  # Re-encode video with adjustments
-        str(output_path)
-    ]
-
     try:
-        run_ffmpeg_command(cmd)
+        get_backend().transcode(input_path, output_path,
+                                video_filter=video_filter, audio_filter=audio_filter)
     except subprocess.CalledProcessError as e:
-        print("FFmpeg contrast adjustment error:", e.stderr.decode())
+        print(f"FFmpeg {label} error:", e.stderr.decode())
         raise
-    except FileNotFoundError:
+    except FileNotFoundError as e:
+        # A missing binary surfaces as a plain FileNotFoundError from
+        # subprocess; PyAV raises its own subclass for a missing input file
+        if type(e) is not FileNotFoundError:
+            raise
         raise Exception(
             "FFmpeg not found! Please install FFmpeg and add it to your system PATH.\nDownload from: https://ffmpeg.org/download.html")
 
     return str(output_path)
 
 
-def ffmpeg_adjust_brightness(input_path, output_path, value):
-    """Adjust video brightness using FFmpeg while preserving audio"""
+def _snap_to_keyframe(video_path, seconds, after=False):
+    """
+    Move a stream-copy cut point onto a real keyframe.
+
+    Uses the asset's sidecar index when there is one; the first cut of an
+    INPUT_DIR asset without one starts building it in the background. Until
+    then, and for intermediates, a cut that
+    starts before ``seconds`` is left to FFmpeg's -ss seek, while a cut that
+    must start after it probes a short window past the point; None means no
+    keyframe could be found there.
+    """
+    index = load_index(video_path)
+    if index is None:
+        if os.path.dirname(os.path.realpath(video_path)) == os.path.realpath(INPUT_DIR):
+            ensure_index_async(video_path)
+        if after:
+            return probe_keyframe_after(video_path, float(seconds))
+        return seconds
+
+    if after:
+        keyframe = index.keyframe_at_or_after(float(seconds))
+    else:
+        keyframe = index.keyframe_at_or_before(float(seconds))
+    return keyframe[0] if keyframe else seconds
+
+
+def safe_filename(name):
+    # Replace unsafe chars with underscore
+    return re.sub(r'[^a-zA-Z0-9_.-]', '_', name)
+
+
+def ffmpeg_trim(input_path, output_path, seconds):
     input_path = Path(input_path)
     output_path = Path(output_path)
 
+    # Ensure destination directory exists
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+
     # Ensure old file removed
     if output_path.exists():
         output_path.unlink()
 
-    # Convert value to brightness filter format
-    brightness_value = value / 100.0  # Normalize value
+    # Stream copy can only start on a keyframe, so seek straight to it
+    start = _snap_to_keyframe(input_path, seconds)
 
     cmd = [
         "ffmpeg", "-y",
+        "-ss", str(start),
         "-i", str(input_path),
-        # Video filter for brightness
-        "-vf", f"eq=brightness={brightness_value}",
-        "-c:a", "copy",  # Copy audio without re-encoding
-        "-c:v", "libx264",  # Re-encode video with adjustments
+        "-c", "copy",  # Copy both video and audio without re-encoding
         str(output_path)
     ]
-
     try:
         run_ffmpeg_command(cmd)
     except subprocess.CalledProcessError as e:
-        print("FFmpeg brightness adjustment error:", e.stderr.decode())
+        print("FFmpeg error:", e.stderr.decode())
         raise
     except FileNotFoundError:
         raise Exception(
@@ -144,250 +192,105 @@ def ffmpeg_adjust_brightness(input_path, output_path, value):
     return str(output_path)
 
 
-def ffmpeg_adjust_saturation(input_path, output_path, value):
-    """Adjust video saturation using FFmpeg while preserving audio"""
-    input_path = Path(input_path)
-    output_path = Path(output_path)
+def ffmpeg_adjust_contrast(input_path, output_path, value):
+    """Adjust video contrast using FFmpeg while preserving audio"""
+    # Convert value to contrast filter format (1.0 = normal, 0.5 = less contrast, 2.0 = more contrast)
+    contrast_factor = 1 + (value / 100.0)
 
-    # Ensure old file removed
-    if output_path.exists():
-        output_path.unlink()
+    return _transcode(input_path, output_path, "contrast adjustment",
+                      video_filter=f"eq=contrast={contrast_factor}")
 
-    # Convert value to saturation filter format (1.0 = normal, 0.5 = less saturated, 2.0 = more saturated)
-    saturation_factor = 1 + (value / 100.0)
 
-    cmd = [
-        "ffmpeg", "-y",
-        "-i", str(input_path),
-        "-vf", f"eq=saturation={saturation_factor}",
-        "-c:a", "copy",
-        "-c:v", "libx264",
-        str(output_path)
-    ]
+def ffmpeg_adjust_brightness(input_path, output_path, value):
+    """Adjust video brightness using FFmpeg while preserving audio"""
+    # Convert value to brightness filter format
+    brightness_value = value / 100.0  # Normalize value
 
-    try:
-        run_ffmpeg_command(cmd)
-    except subprocess.CalledProcessError as e:
-        print("FFmpeg saturation adjustment error:", e.stderr.decode())
-        raise
-    except FileNotFoundError:
-        raise Exception(
-            "FFmpeg not found! Please install FFmpeg and add it to your system PATH.\nDownload from: https://ffmpeg.org/download.html")
+    return _transcode(input_path, output_path, "brightness adjustment",
+                      video_filter=f"eq=brightness={brightness_value}")
 
-    return str(output_path)
 
+def ffmpeg_adjust_saturation(input_path, output_path, value):
+    """Adjust video saturation using FFmpeg while preserving audio"""
+    # Convert value to saturation filter format (1.0 = normal, 0.5 = less saturated, 2.0 = more saturated)
+    saturation_factor = 1 + (value / 100.0)
 
-def ffmpeg_adjust_hue(input_path, output_path, value):
-    """Adjust video hue using FFmpeg while preserving audio"""
-    input_path = Path(input_path)
-    output_path = Path(output_path)
+    return _transcode(input_path, output_path, "saturation adjustment",
+                      video_filter=f"eq=saturation={saturation_factor}")
 
-    # Ensure old file removed
-    if output_path.exists():
-        output_path.unlink()
 
+def ffmpeg_adjust_hue(input_path, output_path, value):
+    """Adjust video hue using FFmpeg while preserving audio"""
     # Hue adjustment in degrees (-180 to 180)
     hue_degrees = value
 
-    cmd = [
-        "ffmpeg", "-y",
-        "-i", str(input_path),
-        "-vf", f"hue=h={hue_degrees}",
-        "-c:a", "copy",
-        "-c:v", "libx264",
-        str(output_path)
-    ]
-
-    try:
-        run_ffmpeg_command(cmd)
-    except subprocess.CalledProcessError as e:
-        print("FFmpeg hue adjustment error:", e.stderr.decode())
-        raise
-    except FileNotFoundError:
-        raise Exception(
-            "FFmpeg not found! Please install FFmpeg and add it to your system PATH.\nDownload from: https://ffmpeg.org/download.html")
-
-    return str(output_path)
+    return _transcode(input_path, output_path, "hue adjustment",
+                      video_filter=f"hue=h={hue_degrees}")
 
 
 def ffmpeg_adjust_gamma(input_path, output_path, value):
     """Adjust video gamma using FFmpeg while preserving audio"""
-    input_path = Path(input_path)
-    output_path = Path(output_path)
-
-    # Ensure old file removed
-    if output_path.exists():
-        output_path.unlink()
-
     # Gamma adjustment (1.0 = normal, 0.5 = darker, 2.0 = brighter)
     gamma_value = 1 + (value / 100.0)
 
-    cmd = [
-        "ffmpeg", "-y",
-        "-i", str(input_path),
-        "-vf", f"eq=gamma={gamma_value}",
-        "-c:a", "copy",
-        "-c:v", "libx264",
-        str(output_path)
-    ]
+    return _transcode(input_path, output_path, "gamma adjustment",
+                      video_filter=f"eq=gamma={gamma_value}")
 
-    try:
-        run_ffmpeg_command(cmd)
-    except subprocess.CalledProcessError as e:
-        print("FFmpeg gamma adjustment error:", e.stderr.decode())
-        raise
-    except FileNotFoundError:
-        raise Exception(
-            "FFmpeg not found! Please install FFmpeg and add it to your system PATH.\nDownload from: https://ffmpeg.org/download.html")
 
-    return str(output_path)
+def ffmpeg_apply_lut(input_path, output_path, lut_path):
+    """Apply a 3D LUT (.cube) in a single pass while preserving audio"""
+    # Forward slashes and an escaped drive colon keep Windows paths intact
+    escaped = str(lut_path).replace("\\", "/").replace(":", "\\:")
+
+    # lut3d only outputs RGB; convert back so the encoder keeps 4:2:0 H.264
+    return _transcode(input_path, output_path, "color LUT",
+                      video_filter=f"lut3d=file='{escaped}',format=yuv420p")
 
 
 def ffmpeg_apply_blur(input_path, output_path, value):
     """Apply blur effect to video using FFmpeg while preserving audio"""
-    input_path = Path(input_path)
-    output_path = Path(output_path)
-
-    # Ensure old file removed
-    if output_path.exists():
-        output_path.unlink()
-
     # Blur radius (1-10 typical range)
     blur_radius = max(1, min(10, value))
 
-    cmd = [
-        "ffmpeg", "-y",
-        "-i", str(input_path),
-        "-vf", f"boxblur={blur_radius}:{blur_radius}",
-        "-c:a", "copy",
-        "-c:v", "libx264",
-        str(output_path)
-    ]
-
-    try:
-        run_ffmpeg_command(cmd)
-    except subprocess.CalledProcessError as e:
-        print("FFmpeg blur effect error:", e.stderr.decode())
-        raise
-    except FileNotFoundError:
-        raise Exception(
-            "FFmpeg not found! Please install FFmpeg and add it to your system PATH.\nDownload from: https://ffmpeg.org/download.html")
-
-    return str(output_path)
+    return _transcode(input_path, output_path, "blur effect",
+                      video_filter=f"boxblur={blur_radius}:{blur_radius}")
 
 
 def ffmpeg_apply_sharpen(input_path, output_path, value):
     """Apply sharpen effect to video using FFmpeg while preserving audio"""
-    input_path = Path(input_path)
-    output_path = Path(output_path)
-
-    # Ensure old file removed
-    if output_path.exists():
-        output_path.unlink()
-
     # Sharpen intensity (0.1 to 2.0)
     sharpen_intensity = max(0.1, min(2.0, value / 10.0))
 
-    cmd = [
-        "ffmpeg", "-y",
-        "-i", str(input_path),
-        "-vf", f"unsharp=5:5:{sharpen_intensity}:5:5:{sharpen_intensity}",
-        "-c:a", "copy",
-        "-c:v", "libx264",
-        str(output_path)
-    ]
-
-    try:
-        run_ffmpeg_command(cmd)
-    except subprocess.CalledProcessError as e:
-        print("FFmpeg sharpen effect error:", e.stderr.decode())
-        raise
-    except FileNotFoundError:
-        raise Exception(
-            "FFmpeg not found! Please install FFmpeg and add it to your system PATH.\nDownload from: https://ffmpeg.org/download.html")
-
-    return str(output_path)
+    return _transcode(input_path, output_path, "sharpen effect",
+                      video_filter=f"unsharp=5:5:{sharpen_intensity}:5:5:{sharpen_intensity}")
 
 
 def ffmpeg_adjust_speed(input_path, output_path, speed_factor):
     """Adjust video playback speed using FFmpeg while preserving audio pitch"""
-    input_path = Path(input_path)
-    output_path = Path(output_path)
-
-    # Ensure old file removed
-    if output_path.exists():
-        output_path.unlink()
-
     # Speed factor (0.5 = half speed, 2.0 = double speed)
     speed = max(0.1, min(4.0, speed_factor))
 
-    cmd = [
-        "ffmpeg", "-y",
-        "-i", str(input_path),
-        "-filter_complex", f"[0:v]setpts={1/speed}*PTS[v];[0:a]atempo={speed}[a]",
-        "-map", "[v]", "-map", "[a]",
-        "-c:v", "libx264",
-        "-c:a", "aac",
-        str(output_path)
-    ]
-
-    try:
-        run_ffmpeg_command(cmd)
-        print(f"✅ Applied {speed}x speed adjustment")
-    except subprocess.CalledProcessError as e:
-        print("FFmpeg speed adjustment error:", e.stderr.decode())
-        raise
-    except FileNotFoundError:
-        raise Exception(
-            "FFmpeg not found! Please install FFmpeg and add it to your system PATH.\nDownload from: https://ffmpeg.org/download.html")
-
-    return str(output_path)
+    result = _transcode(input_path, output_path, "speed adjustment",
+                        video_filter=f"setpts={1/speed}*PTS",
+                        audio_filter=f"atempo={speed}")
+    print(f"✅ Applied {speed}x speed adjustment")
+    return result
 
 
 def ffmpeg_rotate_video(input_path, output_path, degrees):
     """Rotate video by specified degrees using FFmpeg while preserving audio"""
-    input_path = Path(input_path)
-    output_path = Path(output_path)
-
-    # Ensure old file removed
-    if output_path.exists():
-        output_path.unlink()
-
     # Convert degrees to radians for FFmpeg
     import math
     radians = math.radians(degrees % 360)
 
-    cmd = [
-        "ffmpeg", "-y",
-        "-i", str(input_path),
-        "-vf", f"rotate={radians}",
-        "-c:a", "copy",
-        "-c:v", "libx264",
-        str(output_path)
-    ]
-
-    try:
-        run_ffmpeg_command(cmd)
-        print(f"✅ Rotated video by {degrees} degrees")
-    except subprocess.CalledProcessError as e:
-        print("FFmpeg rotation error:", e.stderr.decode())
-        raise
-    except FileNotFoundError:
-        raise Exception(
-            "FFmpeg not found! Please install FFmpeg and add it to your system PATH.\nDownload from: https://ffmpeg.org/download.html")
-
-    return str(output_path)
+    result = _transcode(input_path, output_path, "rotation",
+                        video_filter=f"rotate={radians}")
+    print(f"✅ Rotated video by {degrees} degrees")
+    return result
 
 
 def ffmpeg_flip_video(input_path, output_path, direction):
     """Flip video horizontally or vertically using FFmpeg while preserving audio"""
-    input_path = Path(input_path)
-    output_path = Path(output_path)
-
-    # Ensure old file removed
-    if output_path.exists():
-        output_path.unlink()
-
     # Determine flip filter
     if direction.lower() in ["horizontal", "h"]:
         flip_filter = "hflip"
@@ -396,124 +299,35 @@ def ffmpeg_flip_video(input_path, output_path, direction):
     else:
         raise ValueError("Direction must be 'horizontal' or 'vertical'")
 
-    cmd = [
-        "ffmpeg", "-y",
-        "-i", str(input_path),
-        "-vf", flip_filter,
-        "-c:a", "copy",
-        "-c:v", "libx264",
-        str(output_path)
-    ]
-
-    try:
-        run_ffmpeg_command(cmd)
-        print(f"✅ Flipped video {direction}")
-    except subprocess.CalledProcessError as e:
-        print("FFmpeg flip error:", e.stderr.decode())
-        raise
-    except FileNotFoundError:
-        raise Exception(
-            "FFmpeg not found! Please install FFmpeg and add it to your system PATH.\nDownload from: https://ffmpeg.org/download.html")
-
-    return str(output_path)
+    result = _transcode(input_path, output_path, "flip",
+                        video_filter=flip_filter)
+    print(f"✅ Flipped video {direction}")
+    return result
 
 
 def ffmpeg_crop_video(input_path, output_path, x, y, width, height):
     """Crop video to specified dimensions using FFmpeg while preserving audio"""
-    input_path = Path(input_path)
-    output_path = Path(output_path)
-
-    # Ensure old file removed
-    if output_path.exists():
-        output_path.unlink()
-
-    cmd = [
-        "ffmpeg", "-y",
-        "-i", str(input_path),
-        "-vf", f"crop={width}:{height}:{x}:{y}",
-        "-c:a", "copy",
-        "-c:v", "libx264",
-        str(output_path)
-    ]
-
-    try:
-        run_ffmpeg_command(cmd)
-        print(f"✅ Cropped video to {width}x{height} at ({x},{y})")
-    except subprocess.CalledProcessError as e:
-        print("FFmpeg crop error:", e.stderr.decode())
-        raise
-    except FileNotFoundError:
-        raise Exception(
-            "FFmpeg not found! Please install FFmpeg and add it to your system PATH.\nDownload from: https://ffmpeg.org/download.html")
-
-    return str(output_path)
+    result = _transcode(input_path, output_path, "crop",
+                        video_filter=f"crop={width}:{height}:{x}:{y}")
+    print(f"✅ Cropped video to {width}x{height} at ({x},{y})")
+    return result
 
 
 def ffmpeg_scale_video(input_path, output_path, width, height):
     """Scale/resize video to specified dimensions using FFmpeg while preserving audio"""
-    input_path = Path(input_path)
-    output_path = Path(output_path)
-
-    # Ensure old file removed
-    if output_path.exists():
-        output_path.unlink()
-
-    # Handle aspect ratio preservation
-    scale_filter = f"scale={width}:{height}"
-    if width == -1 or height == -1:
-        scale_filter = f"scale={width}:{height}"  # -1 maintains aspect ratio
-
-    cmd = [
-        "ffmpeg", "-y",
-        "-i", str(input_path),
-        "-vf", scale_filter,
-        "-c:a", "copy",
-        "-c:v", "libx264",
-        str(output_path)
-    ]
-
-    try:
-        run_ffmpeg_command(cmd)
-        print(f"✅ Scaled video to {width}x{height}")
-    except subprocess.CalledProcessError as e:
-        print("FFmpeg scale error:", e.stderr.decode())
-        raise
-    except FileNotFoundError:
-        raise Exception(
-            "FFmpeg not found! Please install FFmpeg and add it to your system PATH.\nDownload from: https://ffmpeg.org/download.html")
-
-    return str(output_path)
+    # -1 for either dimension maintains aspect ratio
+    result = _transcode(input_path, output_path, "scale",
+                        video_filter=f"scale={width}:{height}")
+    print(f"✅ Scaled video to {width}x{height}")
+    return result
 
 
 def ffmpeg_adjust_volume(input_path, output_path, volume_db):
     """Adjust audio volume using FFmpeg while preserving video"""
-    input_path = Path(input_path)
-    output_path = Path(output_path)
-
-    # Ensure old file removed
-    if output_path.exists():
-        output_path.unlink()
-
-    cmd = [
-        "ffmpeg", "-y",
-        "-i", str(input_path),
-        "-af", f"volume={volume_db}dB",
-        "-c:v", "copy",
-        "-c:a", "aac",
-        str(output_path)
-    ]
-
-    try:
-        run_ffmpeg_command(cmd)
-        print(f"✅ Adjusted volume by {volume_db}dB")
-    except subprocess.CalledProcessError as e:
-        print("FFmpeg volume adjustment error:", e.stderr.decode())
-        raise
-    except FileNotFoundError:
-        raise Exception(
-            "FFmpeg not found! Please install FFmpeg and add it to your system PATH.\nDownload from: https://ffmpeg.org/download.html")
-
-    return str(output_path)
+    result = _transcode(input_path, output_path, "volume adjustment",
+                        audio_filter=f"volume={volume_db}dB")
+    print(f"✅ Adjusted volume by {volume_db}dB")
+    return result
 
 
 def validate_audio_present(video_path):
@@ -527,8 +341,7 @@ def validate_audio_present(video_path):
     ]
 
     try:
-        result = subprocess.run(
-            cmd, capture_output=True, text=True, check=True)
+        result = run_command(cmd, text=True)
         return bool(result.stdout.strip())
     except subprocess.CalledProcessError:
         return False
@@ -560,9 +373,11 @@ def ffmpeg_cut_section(input_path, output_path, start_time, end_time):
     if output_path.exists():
         output_path.unlink()
 
-    # Create temporary directory for intermediate files
-    temp_dir = output_path.parent / "temp_cut"
-    temp_dir.mkdir(exist_ok=True)
+    # Unique directory for intermediate files, inside the job workspace when
+    # there is one, so concurrent cuts never share parts or concat lists
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    temp_dir = Path(tempfile.mkdtemp(
+        prefix="cut_", dir=scratch_dir(output_path.parent)))
 
     # File paths for the two segments
     part1_path = temp_dir / f"part1_{input_path.stem}.mp4"
@@ -582,12 +397,20 @@ def ffmpeg_cut_section(input_path, output_path, start_time, end_time):
 
         run_ffmpeg_command(cmd1)
 
-        # Step 2: Extract second part (end_time to end of video)
-        print(f"📹 Extracting second part: {end_time}s to end")
+        # Step 2: Extract second part (end_time to end of video). Resume on
+        # the first keyframe after end_time so no part of the removed
+        # section leaks back in, and seek on input instead of decoding up to it
+        resume_time = _snap_to_keyframe(input_path, end_time, after=True)
+        if resume_time is None:
+            # No keyframe found after end_time: copying from the previous
+            # one would bring removed footage back, so cut frame-accurately
+            return ffmpeg_cut_ranges(input_path, output_path,
+                                     [[start_time, end_time]], accurate=True)
+        print(f"📹 Extracting second part: {resume_time}s to end")
         cmd2 = [
             "ffmpeg", "-y",
+            "-ss", str(resume_time),  # Start from the keyframe at end_time
             "-i", str(input_path),
-            "-ss", str(end_time),  # Start from end_time
             "-c", "copy",  # Copy without re-encoding
             str(part2_path)
         ]
@@ -624,17 +447,161 @@ def ffmpeg_cut_section(input_path, output_path, start_time, end_time):
 
     finally:
         # Cleanup temporary files
-        for temp_file in [part1_path, part2_path, concat_list_path]:
-            if temp_file.exists():
-                try:
-                    temp_file.unlink()
-                except:
-                    pass
-
-        # Remove temp directory if empty
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+    return str(output_path)
+
+
+def _normalize_ranges(ranges):
+    """Turn [[s, e], {"start_time": s, "end_time": e}, ...] into sorted, merged (s, e) tuples"""
+    intervals = []
+    for item in ranges:
+        if isinstance(item, dict):
+            start = item.get("start_time", item.get("start"))
+            end = item.get("end_time", item.get("end"))
+        else:
+            start, end = item
+        start = max(0.0, float(start))
+        end = None if end is None else float(end)
+        if end is not None and end <= start:
+            raise ValueError(f"Invalid range: {start}-{end}")
+        intervals.append((start, end))
+
+    intervals.sort(key=lambda r: r[0])
+    merged = []
+    for start, end in intervals:
+        if merged and (merged[-1][1] is None or start <= merged[-1][1]):
+            last_start, last_end = merged[-1]
+            merged[-1] = (last_start, None if last_end is None or end is None
+                          else max(last_end, end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def _keep_intervals(remove, duration):
+    """Complement of the removed intervals over [0, duration]"""
+    keep = []
+    cursor = 0.0
+    for start, end in remove:
+        if start > cursor:
+            keep.append((cursor, start))
+        if end is None:
+            return keep
+        cursor = end
+    if duration is None or cursor < duration:
+        keep.append((cursor, None))
+    return keep
+
+
+def _concat_quote(path):
+    # Concat demuxer paths are single-quoted; escape embedded quotes
+    return "'" + str(path).replace("'", "'\\''") + "'"
+
+
+def ffmpeg_cut_ranges(input_path, output_path, ranges, mode="remove", accurate=False):
+    """
+    Keep or remove several time ranges in a single FFmpeg pass.
+
+    By default this stream-copies through the concat demuxer, listing the
+    same input once per kept interval with inpoint/outpoint. Kept intervals
+    start on the first keyframe at or after the requested time so no removed
+    content leaks back in; keyframes come from the sidecar index, or for
+    files without one (uploads, intermediates) from a short ffprobe window
+    after each cut point. If any start cannot be placed on a keyframe, or
+    with ``accurate=True``, the kept intervals are picked frame-exactly with
+    select/aselect and re-encoded instead.
+
+    Args:
+        input_path: Path to input video
+        output_path: Path for output video
+        ranges: List of [start, end] pairs or dicts with start_time/end_time
+            in seconds; end may be None for "to the end"
+        mode: "remove" to cut the ranges out, "keep" to keep only them
+        accurate: Use frame-accurate re-encoding instead of stream copy
+
+    Returns:
+        Path to the output video
+    """
+    input_path = Path(input_path)
+    output_path = Path(output_path)
+
+    if mode not in ("remove", "keep"):
+        raise ValueError("Mode must be 'remove' or 'keep'")
+
+    intervals = _normalize_ranges(ranges)
+    if mode == "remove":
+        intervals = _keep_intervals(intervals, get_video_duration(input_path))
+    if not intervals:
+        raise ValueError("cut_ranges would remove the entire video")
+
+    starts = []
+    if not accurate:
+        for start, end in intervals:
+            if start > 0:
+                start = _snap_to_keyframe(input_path, start, after=True)
+                if start is None:
+                    print("⚠️  No keyframe found after a cut point - cutting frame-accurately")
+                    accurate = True
+                    break
+            starts.append(start)
+
+    if accurate:
+        conditions = "+".join(
+            f"between(t,{start},{end})" if end is not None else f"gte(t,{start})"
+            for start, end in intervals)
+        result = _transcode(
+            input_path, output_path, "cut ranges",
+            video_filter=f"select='{conditions}',setpts=N/FRAME_RATE/TB",
+            audio_filter=f"aselect='{conditions}',asetpts=N/SR/TB")
+        print(f"✅ Kept {len(intervals)} ranges (frame accurate)")
+        return result
+
+    # Ensure old file removed
+    if output_path.exists():
+        output_path.unlink()
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+
+    lines = []
+    kept = 0
+    for start, (_, end) in zip(starts, intervals):
+        if end is not None and start >= end:
+            continue  # No keyframe inside this interval to start from
+        lines.append(f"file {_concat_quote(input_path.absolute())}")
+        lines.append(f"inpoint {start}")
+        if end is not None:
+            lines.append(f"outpoint {end}")
+        kept += 1
+    if not kept:
+        raise ValueError("No keyframe-aligned ranges left to keep")
+
+    concat_list = tempfile.NamedTemporaryFile(
+        "w", suffix=".txt", prefix="concat_", dir=scratch_dir(output_path.parent),
+        delete=False)
+    try:
+        with concat_list:
+            concat_list.write("\n".join(lines) + "\n")
+
+        cmd = [
+            "ffmpeg", "-y",
+            "-f", "concat",
+            "-safe", "0",
+            "-i", concat_list.name,
+            "-c", "copy",
+            str(output_path)
+        ]
+        run_ffmpeg_command(cmd)
+        print(f"✅ Kept {kept} ranges in one pass")
+    except subprocess.CalledProcessError as e:
+        print("FFmpeg cut ranges error:", e.stderr.decode())
+        raise
+    except FileNotFoundError:
+        raise Exception(
+            "FFmpeg not found! Please install FFmpeg and add it to your system PATH.\nDownload from: https://ffmpeg.org/download.html")
+    finally:
         try:
-            temp_dir.rmdir()
-        except:
+            os.remove(concat_list.name)
+        except OSError:
             pass
 
     return str(output_path)
@@ -650,11 +617,177 @@ def get_video_duration(video_path):
     ]
 
     try:
-        result = subprocess.run(
-            cmd, capture_output=True, text=True, check=True)
+        result = run_command(cmd, text=True)
         return float(result.stdout.strip())
     except (subprocess.CalledProcessError, ValueError):
         return None
     except FileNotFoundError:
         print("⚠️  FFprobe not found - cannot get video duration.")
         return None
+
+
+def get_video_resolution(video_path):
+    """Get the (width, height) of the first video stream"""
+    cmd = [
+        "ffprobe", "-v", "quiet",
+        "-select_streams", "v:0",
+        "-show_entries", "stream=width,height",
+        "-of", "csv=p=0:s=x",
+        str(video_path)
+    ]
+
+    try:
+        result = run_command(cmd, text=True)
+        width, height = result.stdout.strip().split("x")[:2]
+        return int(width), int(height)
+    except (subprocess.CalledProcessError, ValueError):
+        return None
+    except FileNotFoundError:
+        print("⚠️  FFprobe not found - cannot get video resolution.")
+        return None
+
+
+def probe_metadata(video_path):
+    """
+    Get duration, resolution and audio presence with a single ffprobe call.
+
+    Returns a dict, or None if the file could not be probed. FileNotFoundError
+    propagates when ffprobe itself is missing so callers do not cache it.
+    """
+    cmd = [
+        "ffprobe", "-v", "quiet",
+        "-show_entries", "format=duration:stream=codec_type,width,height",
+        "-of", "json",
+        str(video_path)
+    ]
+
+    try:
+        result = run_command(cmd, text=True)
+        info = json.loads(result.stdout or "{}")
+    except (subprocess.CalledProcessError, ValueError):
+        return None
+
+    streams = info.get("streams", [])
+    video = next((s for s in streams if s.get("codec_type") == "video"), {})
+    try:
+        duration = float(info.get("format", {}).get("duration"))
+    except (TypeError, ValueError):
+        duration = None
+
+    return {
+        "duration": duration,
+        "width": video.get("width"),
+        "height": video.get("height"),
+        "has_audio": any(s.get("codec_type") == "audio" for s in streams)
+    }
+
+
+def ffmpeg_package_adaptive(input_path, output_dir, renditions, has_audio=True,
+                            fmt="hls", segment_seconds=4):
+    """
+    Package a video as an adaptive-bitrate ladder from a single decode.
+
+    The source is decoded once and fanned out with ``split`` to one scaler and
+    encoder per rendition. Keyframes are forced on segment boundaries so every
+    rendition switches cleanly.
+
+    Args:
+        input_path: Path to input video
+        output_dir: Directory that receives playlists and segments
+        renditions: List of dicts with height, video_bitrate and audio_bitrate
+        has_audio: Whether to map the first audio stream into each rendition
+        fmt: "hls" for MPEG-TS HLS, or "dash" for fMP4 DASH with an HLS
+            master playlist over the same segments
+        segment_seconds: Target segment duration
+
+    Returns:
+        Path to the master manifest (master.m3u8 for HLS, manifest.mpd for DASH)
+    """
+    input_path = Path(input_path)
+    output_dir = Path(output_dir)
+
+    if not renditions:
+        raise ValueError("At least one rendition is required")
+    if fmt not in ("hls", "dash"):
+        raise ValueError("Format must be 'hls' or 'dash'")
+
+    # Ensure stale segments from an earlier run are removed
+    if output_dir.exists():
+        shutil.rmtree(output_dir)
+    output_dir.mkdir(parents=True)
+
+    count = len(renditions)
+    split_labels = "".join(f"[s{i}]" for i in range(count))
+    scalers = ";".join(
+        f"[s{i}]scale=-2:{r['height']}[v{i}]" for i, r in enumerate(renditions))
+    filter_graph = f"[0:v]split={count}{split_labels};{scalers}"
+
+    cmd = [
+        "ffmpeg", "-y",
+        "-i", str(input_path),
+        "-filter_complex", filter_graph,
+    ]
+    for i, rendition in enumerate(renditions):
+        cmd += [
+            "-map", f"[v{i}]",
+            f"-c:v:{i}", encoder_tuning.video_encoder(),
+            f"-b:v:{i}", rendition["video_bitrate"],
+        ]
+        # Tuned options apply per output stream, e.g. -preset:v:0
+        tuned = encoder_tuning.encoder_args(rendition["height"])
+        for option, value in zip(tuned[::2], tuned[1::2]):
+            cmd += [f"{option}:v:{i}", value]
+    if has_audio:
+        for i, rendition in enumerate(renditions):
+            cmd += [
+                "-map", "a:0",
+                f"-c:a:{i}", "aac",
+                f"-b:a:{i}", rendition["audio_bitrate"],
+            ]
+    cmd += [
+        "-force_key_frames", f"expr:gte(t,n_forced*{segment_seconds})",
+        "-sc_threshold", "0",
+    ]
+
+    if fmt == "hls":
+        if has_audio:
+            stream_map = " ".join(f"v:{i},a:{i}" for i in range(count))
+        else:
+            stream_map = " ".join(f"v:{i}" for i in range(count))
+        cmd += [
+            "-f", "hls",
+            "-hls_time", str(segment_seconds),
+            "-hls_playlist_type", "vod",
+            "-hls_flags", "independent_segments",
+            "-master_pl_name", "master.m3u8",
+            "-var_stream_map", stream_map,
+            "-hls_segment_filename", str(output_dir / "stream_%v" / "seg_%05d.ts"),
+            str(output_dir / "stream_%v" / "playlist.m3u8")
+        ]
+        manifest = output_dir / "master.m3u8"
+    else:
+        adaptation_sets = "id=0,streams=v id=1,streams=a" if has_audio else "id=0,streams=v"
+        cmd += [
+            "-f", "dash",
+            "-seg_duration", str(segment_seconds),
+            "-use_template", "1",
+            "-use_timeline", "1",
+            "-adaptation_sets", adaptation_sets,
+            "-hls_playlist", "1",  # Also write master.m3u8 for HLS players
+            "-init_seg_name", "init_$RepresentationID$.m4s",
+            "-media_seg_name", "chunk_$RepresentationID$_$Number%05d$.m4s",
+            str(output_dir / "manifest.mpd")
+        ]
+        manifest = output_dir / "manifest.mpd"
+
+    try:
+        run_ffmpeg_command(cmd)
+        print(f"✅ Packaged {count} renditions as {fmt.upper()}")
+    except subprocess.CalledProcessError as e:
+        print("FFmpeg adaptive packaging error:", e.stderr.decode())
+        raise
+    except FileNotFoundError:
+        raise Exception(
+            "FFmpeg not found! Please install FFmpeg and add it to your system PATH.\nDownload from: https://ffmpeg.org/download.html")
+
+    return str(manifest)
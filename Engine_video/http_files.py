@@ -0,0 +1,189 @@
+"""
+Conditional and byte-range file responses.
+
+Outputs never change once written, so they are served with a strong ETag
+derived from their content hash, honour If-None-Match / If-Modified-Since,
+and answer Range requests with 206.
+
+Bodies use the ASGI zero-copy send extension (sendfile) only when the server
+advertises it. uvicorn does not, and an ASGI app never sees the client
+socket, so os.sendfile cannot be called from here. Under uvicorn, files are
+streamed in chunks read in a worker thread. For kernel zero-copy, serve
+OUTPUT_DIR and STREAM_DIR from a reverse proxy with sendfile enabled.
+"""
+import os
+import threading
+from email.utils import formatdate, parsedate_to_datetime
+from urllib.parse import quote
+
+import anyio
+from starlette.responses import Response
+
+from render_cache import hash_asset
+
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+_CHUNK_SIZE = 256 * 1024
+_ETAG_CACHE_MAX = 4096
+
+_etag_cache = {}
+_etag_lock = threading.Lock()
+
+
+def content_etag(path, stat):
+    """Strong ETag from the file's SHA-256, hashed once per (path, size, mtime)"""
+    key = (path, stat.st_size, stat.st_mtime_ns)
+    with _etag_lock:
+        etag = _etag_cache.get(key)
+    if etag is None:
+        etag = f'"{hash_asset(path)[:32]}"'
+        with _etag_lock:
+            if len(_etag_cache) >= _ETAG_CACHE_MAX:
+                _etag_cache.clear()
+            _etag_cache[key] = etag
+    return etag
+
+
+def _etag_matches(header, etag):
+    # If-None-Match uses weak comparison, so W/ prefixes are ignored
+    for tag in header.split(","):
+        tag = tag.strip()
+        if tag == "*" or tag.removeprefix("W/") == etag:
+            return True
+    return False
+
+
+def _not_modified_since(header, mtime):
+    try:
+        since = parsedate_to_datetime(header)
+    except (TypeError, ValueError):
+        return False
+    if since is None:
+        return False
+    # HTTP dates have one-second resolution
+    return int(mtime) <= since.timestamp()
+
+
+def _parse_range(header, size):
+    """
+    Parse a single "bytes=" range.
+
+    Returns (start, end) inclusive, None to ignore the header (serve 200),
+    or False when the range cannot be satisfied (416).
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None  # Multiple ranges are optional; serve the whole file
+    first, sep, last = spec.strip().partition("-")
+    if not sep:
+        return None
+    if size == 0:
+        return False  # No byte of an empty file can be selected
+    try:
+        if first == "":
+            # Suffix range: last N bytes
+            length = int(last)
+            if length <= 0:
+                return False
+            return max(0, size - length), size - 1
+        start = int(first)
+        end = int(last) if last else size - 1
+    except ValueError:
+        return None
+    if start >= size or end < start:
+        return False
+    return start, min(end, size - 1)
+
+
+class RangeFileResponse(Response):
+    """Send [start, end] of a file, via zero-copy sendfile if the server offers it"""
+
+    def __init__(self, path, start, end, status_code, headers, media_type,
+                 send_body=True):
+        super().__init__(status_code=status_code, headers=headers,
+                         media_type=media_type)
+        self.path = path
+        self.start = start
+        self.end = end
+        self.send_body = send_body
+        # HEAD reports the length a GET would send
+        self.headers["Content-Length"] = str(end - start + 1)
+
+    async def __call__(self, scope, receive, send):
+        await send({
+            "type": "http.response.start",
+            "status": self.status_code,
+            "headers": self.raw_headers,
+        })
+        if not self.send_body or self.end < self.start:
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        count = self.end - self.start + 1
+        zerocopy = "http.response.zerocopy" in scope.get("extensions", {})
+        with open(self.path, "rb") as f:
+            if zerocopy:
+                await send({
+                    "type": "http.response.zerocopy",
+                    "file": f.fileno(),
+                    "offset": self.start,
+                    "count": count,
+                })
+                return
+
+            f.seek(self.start)
+            remaining = count
+            while remaining:
+                chunk = await anyio.to_thread.run_sync(
+                    f.read, min(_CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk,
+                            "more_body": remaining > 0})
+            if remaining:
+                await send({"type": "http.response.body", "body": b""})
+
+
+async def file_response(request, path, media_type, filename=None,
+                        cache_control=IMMUTABLE_CACHE_CONTROL):
+    """Build a 200/206/304/416 response for ``path`` from the request headers"""
+    stat = os.stat(path)
+    # First request for a file hashes it; keep that off the event loop
+    etag = await anyio.to_thread.run_sync(content_etag, path, stat)
+    headers = {
+        "ETag": etag,
+        "Last-Modified": formatdate(stat.st_mtime, usegmt=True),
+        "Cache-Control": cache_control,
+        "Accept-Ranges": "bytes",
+    }
+    if filename:
+        headers["Content-Disposition"] = f"attachment; filename*=utf-8''{quote(filename)}"
+
+    # If-None-Match takes precedence over If-Modified-Since (RFC 9110 13.2.2)
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        if _etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers=headers)
+    elif request.headers.get("if-modified-since") and _not_modified_since(
+            request.headers["if-modified-since"], stat.st_mtime):
+        return Response(status_code=304, headers=headers)
+
+    send_body = request.method != "HEAD"
+    size = stat.st_size
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    # A stale If-Range validator means "send the whole (new) file"
+    if range_header and (if_range is None or if_range.strip() in (etag, headers["Last-Modified"])):
+        byte_range = _parse_range(range_header, size)
+        if byte_range is False:
+            headers["Content-Range"] = f"bytes */{size}"
+            return Response(status_code=416, headers=headers)
+        if byte_range is not None:
+            start, end = byte_range
+            headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+            return RangeFileResponse(path, start, end, 206, headers, media_type,
+                                     send_body=send_body)
+
+    return RangeFileResponse(path, 0, size - 1, 200, headers, media_type,
+                             send_body=send_body)
@@ -0,0 +1,189 @@
+import json
+from abc import ABC, abstractmethod
+import sqlite3
+import time
+import uuid
+from contextlib import closing
+
+from config import (
+    JOB_QUEUE_BACKEND, JOB_DB_PATH, JOB_LEASE_SECONDS, JOB_MAX_ATTEMPTS
+)
+
+
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+
+
+class JobQueue(ABC):
+    """
+    Durable job queue shared by API nodes and worker nodes.
+
+    Workers claim a job under a lease and must heartbeat before it expires.
+    A job whose lease lapses (worker died or hung) is handed to the next
+    worker that asks, until it has been attempted ``max_attempts`` times.
+    """
+
+    @abstractmethod
+    def enqueue(self, payload, max_attempts=JOB_MAX_ATTEMPTS):
+        raise NotImplementedError
+
+    @abstractmethod
+    def get(self, job_id):
+        raise NotImplementedError
+
+    @abstractmethod
+    def claim(self, worker_id, lease_seconds=JOB_LEASE_SECONDS):
+        raise NotImplementedError
+
+    @abstractmethod
+    def heartbeat(self, job_id, worker_id, lease_seconds=JOB_LEASE_SECONDS):
+        raise NotImplementedError
+
+    @abstractmethod
+    def complete(self, job_id, worker_id, result):
+        raise NotImplementedError
+
+    @abstractmethod
+    def fail(self, job_id, worker_id, error):
+        raise NotImplementedError
+
+
+class SQLiteJobQueue(JobQueue):
+    """
+    JobQueue backed by a single SQLite file.
+
+    Claims run inside ``BEGIN IMMEDIATE`` so only one process can take the
+    write lock and pick a job at a time. The rollback journal is used instead
+    of WAL because WAL requires shared memory and does not work when the
+    database lives on network storage shared between machines.
+    """
+
+    def __init__(self, db_path=JOB_DB_PATH):
+        self.db_path = db_path
+        with closing(self._connect()) as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    result TEXT,
+                    error TEXT,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    max_attempts INTEGER NOT NULL,
+                    worker_id TEXT,
+                    lease_expires REAL,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            """)
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, created_at)")
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    @staticmethod
+    def _to_dict(row):
+        if row is None:
+            return None
+        job = dict(row)
+        job["payload"] = json.loads(job["payload"])
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def enqueue(self, payload, max_attempts=JOB_MAX_ATTEMPTS):
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with closing(self._connect()) as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, status, payload, max_attempts, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (job_id, QUEUED, json.dumps(payload), max_attempts, now, now))
+        return job_id
+
+    def get(self, job_id):
+        with closing(self._connect()) as conn:
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._to_dict(row)
+
+    def claim(self, worker_id, lease_seconds=JOB_LEASE_SECONDS):
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+
+            # Jobs whose worker died on the final attempt will never finish
+            conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, updated_at = ? "
+                "WHERE status = ? AND lease_expires < ? AND attempts >= max_attempts",
+                (FAILED, "Lease expired on final attempt", now, RUNNING, now))
+
+            row = conn.execute(
+                "SELECT * FROM jobs "
+                "WHERE status = ? OR (status = ? AND lease_expires < ?) "
+                "ORDER BY created_at LIMIT 1",
+                (QUEUED, RUNNING, now)).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+
+            conn.execute(
+                "UPDATE jobs SET status = ?, worker_id = ?, lease_expires = ?, "
+                "attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                (RUNNING, worker_id, now + lease_seconds, now, row["id"]))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+        return self.get(row["id"])
+
+    def heartbeat(self, job_id, worker_id, lease_seconds=JOB_LEASE_SECONDS):
+        """Extend the lease. Returns False if the job is no longer ours."""
+        now = time.time()
+        with closing(self._connect()) as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET lease_expires = ?, updated_at = ? "
+                "WHERE id = ? AND worker_id = ? AND status = ?",
+                (now + lease_seconds, now, job_id, worker_id, RUNNING))
+        return cursor.rowcount == 1
+
+    def complete(self, job_id, worker_id, result):
+        with closing(self._connect()) as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, lease_expires = NULL, updated_at = ? "
+                "WHERE id = ? AND worker_id = ? AND status = ?",
+                (COMPLETED, json.dumps(result), time.time(), job_id, worker_id, RUNNING))
+        return cursor.rowcount == 1
+
+    def fail(self, job_id, worker_id, error):
+        """Requeue the job, or mark it failed once attempts are exhausted"""
+        with closing(self._connect()) as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET "
+                "status = CASE WHEN attempts >= max_attempts THEN ? ELSE ? END, "
+                "error = ?, worker_id = NULL, lease_expires = NULL, updated_at = ? "
+                "WHERE id = ? AND worker_id = ? AND status = ?",
+                (FAILED, QUEUED, str(error), time.time(), job_id, worker_id, RUNNING))
+        return cursor.rowcount == 1
+
+
+JOB_QUEUE_BACKENDS = {
+    "sqlite": SQLiteJobQueue,
+}
+
+
+def get_job_queue():
+    """Create the job queue selected by JOB_QUEUE_BACKEND"""
+    try:
+        backend = JOB_QUEUE_BACKENDS[JOB_QUEUE_BACKEND]
+    except KeyError:
+        raise ValueError(f"Unknown job queue backend: {JOB_QUEUE_BACKEND}")
+    return backend()
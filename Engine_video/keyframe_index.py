@@ -0,0 +1,207 @@
+import os
+import struct
+import subprocess
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+
+from profiler import run_command
+
+
+SIDECAR_SUFFIX = ".kfidx"
+_MAGIC = b"KFX1"
+# source size, source mtime_ns, packet count, container start_time
+_HEADER = struct.Struct("<qqId")
+# How far past a cut point to look for a keyframe when there is no sidecar
+_PROBE_WINDOW_SECONDS = 20
+
+_building = set()  # Assets whose sidecar is being built in the background
+_building_lock = threading.Lock()
+
+
+class KeyframeIndex:
+    """
+    Packet index for the first video stream of an asset.
+
+    Timestamps are stored relative to the container start so they can be fed
+    straight to ``-ss``. Packets are kept in three parallel arrays (pts, byte
+    offset, keyframe flag); keyframe times are split out once on load so
+    lookups are a single bisect.
+    """
+
+    def __init__(self, pts, positions, flags, start_time=0.0):
+        self.pts = pts
+        self.positions = positions
+        self.flags = flags
+        self.start_time = start_time
+
+        order = sorted(
+            (t, p) for t, p, k in zip(pts, positions, flags) if k)
+        self.keyframe_times = array("d", (t for t, _ in order))
+        self.keyframe_positions = array("q", (p for _, p in order))
+
+    def __len__(self):
+        return len(self.pts)
+
+    def keyframe_at_or_before(self, seconds):
+        """Return (time, byte_offset) of the last keyframe <= seconds"""
+        i = bisect_right(self.keyframe_times, seconds) - 1
+        if i < 0:
+            return None
+        return self.keyframe_times[i], self.keyframe_positions[i]
+
+    def keyframe_at_or_after(self, seconds):
+        """Return (time, byte_offset) of the first keyframe >= seconds"""
+        i = bisect_left(self.keyframe_times, seconds)
+        if i >= len(self.keyframe_times):
+            return None
+        return self.keyframe_times[i], self.keyframe_positions[i]
+
+
+def sidecar_path(video_path):
+    return f"{video_path}{SIDECAR_SUFFIX}"
+
+
+def _source_signature(video_path):
+    stat = os.stat(video_path)
+    return stat.st_size, stat.st_mtime_ns
+
+
+def _probe_packets(video_path, read_intervals=None):
+    cmd = [
+        "ffprobe", "-v", "quiet",
+        "-select_streams", "v:0",
+        "-show_entries", "packet=pts_time,pos,flags:format=start_time",
+        "-of", "csv",
+    ]
+    if read_intervals:
+        cmd += ["-read_intervals", read_intervals]
+    cmd.append(str(video_path))
+    result = run_command(cmd, text=True)
+
+    start_time = 0.0
+    packets = []
+    for line in result.stdout.splitlines():
+        fields = line.split(",")
+        if fields[0] == "format" and len(fields) > 1:
+            try:
+                start_time = float(fields[1])
+            except ValueError:
+                pass
+        elif fields[0] == "packet" and len(fields) >= 4:
+            try:
+                pts = float(fields[1])
+            except ValueError:
+                continue  # N/A timestamps carry no seek information
+            pos = int(fields[2]) if fields[2].lstrip("-").isdigit() else -1
+            packets.append((pts, pos, 1 if fields[3].startswith("K") else 0))
+
+    return start_time, packets
+
+
+def build_index(video_path):
+    """Probe every video packet once and write the sidecar next to the asset"""
+    start_time, packets = _probe_packets(video_path)
+    pts = array("d", (p[0] - start_time for p in packets))
+    positions = array("q", (p[1] for p in packets))
+    flags = array("B", (p[2] for p in packets))
+
+    size, mtime_ns = _source_signature(video_path)
+    path = sidecar_path(video_path)
+    temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temp_path, "wb") as f:
+        f.write(_MAGIC)
+        f.write(_HEADER.pack(size, mtime_ns, len(pts), start_time))
+        pts.tofile(f)
+        positions.tofile(f)
+        flags.tofile(f)
+    os.replace(temp_path, path)
+
+    return KeyframeIndex(pts, positions, flags, start_time)
+
+
+def _read_index(video_path):
+    path = sidecar_path(video_path)
+    with open(path, "rb") as f:
+        if f.read(len(_MAGIC)) != _MAGIC:
+            return None
+        size, mtime_ns, count, start_time = _HEADER.unpack(f.read(_HEADER.size))
+        if (size, mtime_ns) != _source_signature(video_path):
+            return None  # Asset was rewritten since the index was built
+        pts, positions, flags = array("d"), array("q"), array("B")
+        pts.fromfile(f, count)
+        positions.fromfile(f, count)
+        flags.fromfile(f, count)
+    return KeyframeIndex(pts, positions, flags, start_time)
+
+
+def load_index(video_path):
+    """
+    Return the keyframe index for an asset, or None if it has no valid sidecar.
+
+    Indexes are built in the background for persistent assets (see
+    ``ensure_index_async``); until one exists, and for anything else, callers
+    probe around the cut point instead of paying for a full packet scan.
+    """
+    try:
+        return _read_index(video_path)
+    except (OSError, EOFError, struct.error):
+        return None
+
+
+def ensure_index(video_path):
+    """Build the sidecar for a persistent asset unless a valid one exists"""
+    index = load_index(video_path)
+    if index is not None:
+        return index
+
+    try:
+        return build_index(video_path)
+    except (subprocess.CalledProcessError, FileNotFoundError, OSError) as e:
+        print(f"⚠️  Could not build keyframe index for {video_path}: {e}")
+        return None
+
+
+def ensure_index_async(video_path):
+    """Build the sidecar on a background thread, once per asset at a time"""
+    key = os.path.realpath(video_path)
+    with _building_lock:
+        if key in _building:
+            return
+        _building.add(key)
+
+    def build():
+        try:
+            ensure_index(video_path)
+        finally:
+            with _building_lock:
+                _building.discard(key)
+
+    threading.Thread(target=build, name="keyframe-index", daemon=True).start()
+
+
+def probe_keyframe_after(video_path, seconds, window=_PROBE_WINDOW_SECONDS):
+    """
+    Return the time of the first keyframe at or after ``seconds`` without a sidecar.
+
+    Only the packets of a short window are read (``-read_intervals``, offset
+    from the container start), so this costs one small ffprobe rather than a
+    full scan. Returns None if the window holds no keyframe or the probe failed.
+    """
+    try:
+        start_time, packets = _probe_packets(
+            video_path, read_intervals=f"+{seconds}%+{window}")
+    except (subprocess.CalledProcessError, FileNotFoundError):
+        return None
+
+    times = [pts - start_time for pts, _, key in packets
+             if key and pts - start_time >= seconds]
+    return min(times) if times else None
+
+
+def discard_index(video_path):
+    """Remove an asset's sidecar, e.g. when the asset itself is deleted"""
+    try:
+        os.remove(sidecar_path(video_path))
+    except OSError:
+        pass
@@ -1,16 +1,53 @@
-from fastapi import FastAPI, UploadFile, Form, HTTPException, Header
-from fastapi.responses import FileResponse
+from fastapi import FastAPI, UploadFile, Form, HTTPException, Header, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 import os
+import re
 import json
-from processor import process_video
-from config import API_KEY, INPUT_DIR, OUTPUT_DIR
-from ffmpeg_utils import validate_audio_present
+import time
+from processor import run_edit_job
+from job_queue import get_job_queue
+import uploads
+import asset_library
+from http_files import file_response
+from keyframe_index import discard_index
+import encoder_tuning
+import workspace
+from ffmpeg_utils import FFMPEG_BIN
+from config import (
+    API_KEY, INPUT_DIR, OUTPUT_DIR, STREAM_DIR, UPLOAD_MAX_CHUNK_BYTES,
+    ENCODER_TUNING_ENABLED
+)
 import uuid
 from typing import Optional
 
 app = FastAPI(title="VidPrompt Video Engine")
 
+_job_queue = None
+
+
+def _get_job_queue():
+    # Created lazily so nodes that never queue jobs do not touch the store
+    global _job_queue
+    if _job_queue is None:
+        _job_queue = get_job_queue()
+    return _job_queue
+
+
+@app.on_event("startup")
+def tune_encoders():
+    # Only load cached results: benchmarking here would hold up /health for
+    # minutes. Workers (or `python worker.py --calibrate`) do the calibration
+    if ENCODER_TUNING_ENABLED:
+        encoder_tuning.calibrate(FFMPEG_BIN, cached_only=True)
+
+
+@app.on_event("startup")
+def sweep_workspaces():
+    # Clean up after jobs that were rendering when a previous run crashed
+    workspace.sweep_orphans()
+    uploads.expire_sessions()
+
+
 # Add CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -21,31 +58,55 @@ app.add_middleware(
 )
 
 
-@app.post("/process")
-async def process(
-    file: UploadFile,
-    actions: str = Form(...),
-    output_path: Optional[str] = Form(None),
-    x_api_key: Optional[str] = Header(None)
-):
-    # API Key check (optional for development)
-    if API_KEY and x_api_key != API_KEY:
-        raise HTTPException(status_code=401, detail="Invalid API Key")
+@app.middleware("http")
+async def stamp_request_start(request: Request, call_next):
+    # Runs once the headers arrive, before the body is read, so upload
+    # timings cover receiving the file and not just storing it
+    request.state.received_at = time.perf_counter()
+    return await call_next(request)
+
+
+async def _prepare_job(request, file, actions, output_path, output_format, asset=None):
+    """
+    Validate request fields and save the upload (or resolve the asset) in INPUT_DIR.
+
+    The returned upload time runs from the request's arrival until the file
+    is stored, i.e. the body transfer plus the copy into INPUT_DIR.
+    """
+    output_format = (output_format or "mp4").lower()
+    if output_format not in ("mp4", "hls", "dash"):
+        raise HTTPException(
+            status_code=400, detail="output_format must be mp4, hls or dash")
+    if file is None and not asset:
+        raise HTTPException(
+            status_code=400, detail="Either file or asset is required")
 
     os.makedirs(INPUT_DIR, exist_ok=True)
     os.makedirs(OUTPUT_DIR, exist_ok=True)
 
     # Generate unique filename to avoid conflicts
     unique_id = str(uuid.uuid4())[:8]
-    file_extension = os.path.splitext(
-        file.filename)[1] if file.filename else '.mp4'
 
-    # Save input file
-    input_filename = f"input_{unique_id}_{file.filename}" if file.filename else f"input_{unique_id}{file_extension}"
-    input_path = os.path.join(INPUT_DIR, input_filename)
+    upload_wall_s = 0.0
+    if file is not None:
+        source_name = file.filename
+        file_extension = os.path.splitext(
+            file.filename)[1] if file.filename else '.mp4'
+
+        # Save input file
+        input_filename = f"input_{unique_id}_{file.filename}" if file.filename else f"input_{unique_id}{file_extension}"
+        input_path = os.path.join(INPUT_DIR, input_filename)
 
-    with open(input_path, "wb") as f:
-        f.write(await file.read())
+        with open(input_path, "wb") as f:
+            f.write(await file.read())
+        upload_wall_s = time.perf_counter() - request.state.received_at
+    else:
+        # Asset previously finalized through /uploads
+        input_path = os.path.join(INPUT_DIR, os.path.basename(asset))
+        if input_path.endswith(".part") or not os.path.isfile(input_path):
+            raise HTTPException(status_code=404, detail="Asset not found")
+        source_name = os.path.basename(asset)
+        file_extension = os.path.splitext(source_name)[1] or '.mp4'
 
     # Parse actions JSON
     try:
@@ -57,53 +118,268 @@ async def process(
     if output_path:
         final_output_path = output_path
     else:
-        output_filename = f"edited_{unique_id}_{file.filename}" if file.filename else f"edited_{unique_id}{file_extension}"
+        output_filename = f"edited_{unique_id}_{source_name}" if source_name else f"edited_{unique_id}{file_extension}"
         final_output_path = os.path.join(OUTPUT_DIR, output_filename)
 
-    # Check input audio status
-    input_has_audio = validate_audio_present(input_path)
-    print(
-        f"Input video '{file.filename}' audio: {'Present' if input_has_audio else 'Not present'}")
+    return unique_id, input_path, actions_data, final_output_path, output_format, upload_wall_s
+
+
+@app.post("/process")
+async def process(
+    request: Request,
+    file: Optional[UploadFile] = None,
+    actions: str = Form(...),
+    output_path: Optional[str] = Form(None),
+    output_format: Optional[str] = Form(None),
+    profile: bool = Form(False),
+    asset: Optional[str] = Form(None),
+    x_api_key: Optional[str] = Header(None)
+):
+    # API Key check (optional for development)
+    if API_KEY and x_api_key != API_KEY:
+        raise HTTPException(status_code=401, detail="Invalid API Key")
+
+    unique_id, input_path, actions_data, final_output_path, output_format, upload_wall_s = \
+        await _prepare_job(request, file, actions, output_path, output_format, asset)
 
     # Process the video
     try:
-        process_video(input_path, actions_data, final_output_path)
-
-        # Verify audio preservation
-        output_has_audio = validate_audio_present(final_output_path)
-        audio_status = "preserved" if (
-            input_has_audio and output_has_audio) else "lost" if input_has_audio else "none"
-
-        return {
-            "status": "success",
-            "output": final_output_path,
-            "audio_status": audio_status,
-            "input_had_audio": input_has_audio,
-            "output_has_audio": output_has_audio,
-            "filename": os.path.basename(final_output_path)
-        }
+        return run_edit_job(input_path, actions_data, final_output_path,
+                            output_format=output_format, stream_id=unique_id,
+                            profile=profile, upload_wall_s=upload_wall_s)
 
     except Exception as e:
         print(f"Video processing error: {e}")
-        # Cleanup input file on error
-        if os.path.exists(input_path):
+        # Cleanup input file on error (finalized assets are kept for retries)
+        if file is not None and os.path.exists(input_path):
             os.remove(input_path)
+            discard_index(input_path)
         raise HTTPException(
             status_code=500, detail=f"Video processing failed: {str(e)}")
 
 
-@app.get("/download/{filename}")
-async def download_file(filename: str):
-    """Download processed video file"""
+def _parse_checksum(header):
+    try:
+        return uploads.parse_checksum_header(header)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.post("/uploads")
+async def create_upload(
+    filename: str = Form(...),
+    size: int = Form(...),
+    x_api_key: Optional[str] = Header(None)
+):
+    """Start a resumable upload; chunks can then be PUT in any order"""
+    if API_KEY and x_api_key != API_KEY:
+        raise HTTPException(status_code=401, detail="Invalid API Key")
+
+    try:
+        session = uploads.create_session(filename, size)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return {
+        "upload_id": session["upload_id"],
+        "size": session["size"],
+        "max_chunk_bytes": UPLOAD_MAX_CHUNK_BYTES
+    }
+
+
+@app.put("/uploads/{upload_id}")
+async def upload_chunk(
+    upload_id: str,
+    request: Request,
+    upload_offset: int = Header(...),
+    upload_checksum: Optional[str] = Header(None),
+    x_api_key: Optional[str] = Header(None)
+):
+    """Write one chunk at Upload-Offset, verified against Upload-Checksum"""
+    if API_KEY and x_api_key != API_KEY:
+        raise HTTPException(status_code=401, detail="Invalid API Key")
+
+    checksum = _parse_checksum(upload_checksum)
+    try:
+        length = await uploads.write_chunk(
+            upload_id, upload_offset, request.stream(), checksum)
+    except LookupError:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    except uploads.ChecksumMismatch as e:
+        # 460 is the tus protocol's "Checksum Mismatch" status
+        raise HTTPException(status_code=460, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return {"upload_id": upload_id, "offset": upload_offset, "length": length}
+
+
+@app.head("/uploads/{upload_id}")
+async def upload_offset(upload_id: str, x_api_key: Optional[str] = Header(None)):
+    """tus-style resume probe: report the contiguous received offset"""
+    if API_KEY and x_api_key != API_KEY:
+        raise HTTPException(status_code=401, detail="Invalid API Key")
+
+    try:
+        status = uploads.session_status(upload_id)
+    except LookupError:
+        raise HTTPException(status_code=404, detail="Upload not found")
+
+    return Response(headers={
+        "Upload-Offset": str(status["offset"]),
+        "Upload-Length": str(status["size"]),
+        "Cache-Control": "no-store"
+    })
+
+
+@app.get("/uploads/{upload_id}")
+async def upload_status(upload_id: str, x_api_key: Optional[str] = Header(None)):
+    """List received and missing byte ranges so parallel clients can resume"""
+    if API_KEY and x_api_key != API_KEY:
+        raise HTTPException(status_code=401, detail="Invalid API Key")
+
+    try:
+        return uploads.session_status(upload_id)
+    except LookupError:
+        raise HTTPException(status_code=404, detail="Upload not found")
+
+
+@app.post("/uploads/{upload_id}/finalize")
+def finalize_upload(
+    upload_id: str,
+    upload_checksum: Optional[str] = Header(None),
+    x_api_key: Optional[str] = Header(None)
+):
+    """Turn a complete upload into an asset usable as /process's asset field"""
+    # Plain def: the whole-file checksum runs in the threadpool
+    if API_KEY and x_api_key != API_KEY:
+        raise HTTPException(status_code=401, detail="Invalid API Key")
+
+    checksum = _parse_checksum(upload_checksum)
+    try:
+        return uploads.finalize(upload_id, checksum)
+    except LookupError:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    except uploads.ChecksumMismatch as e:
+        raise HTTPException(status_code=460, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+
+@app.get("/library")
+def list_library(refresh: bool = False, x_api_key: Optional[str] = Header(None)):
+    """List uploaded assets with duration, resolution and audio status"""
+    if API_KEY and x_api_key != API_KEY:
+        raise HTTPException(status_code=401, detail="Invalid API Key")
+
+    # Plain def: FastAPI runs it in the threadpool, so probing never blocks the loop
+    assets, probed = asset_library.scan(force=refresh)
+    return {"assets": assets, "count": len(assets), "probed": probed}
+
+
+@app.post("/jobs")
+async def submit_job(
+    request: Request,
+    file: Optional[UploadFile] = None,
+    actions: str = Form(...),
+    output_path: Optional[str] = Form(None),
+    output_format: Optional[str] = Form(None),
+    profile: bool = Form(False),
+    asset: Optional[str] = Form(None),
+    x_api_key: Optional[str] = Header(None)
+):
+    """Queue an edit job for a worker node instead of rendering in-process"""
+    if API_KEY and x_api_key != API_KEY:
+        raise HTTPException(status_code=401, detail="Invalid API Key")
+
+    unique_id, input_path, actions_data, final_output_path, output_format, upload_wall_s = \
+        await _prepare_job(request, file, actions, output_path, output_format, asset)
+
+    job_id = _get_job_queue().enqueue({
+        "input_path": input_path,
+        "actions": actions_data,
+        "output_path": final_output_path,
+        "output_format": output_format,
+        "stream_id": unique_id,
+        "profile": profile,
+        "upload_wall_s": upload_wall_s
+    })
+
+    return {"status": "queued", "job_id": job_id}
+
+
+@app.get("/jobs/{job_id}")
+async def job_status(job_id: str, x_api_key: Optional[str] = Header(None)):
+    """Report the state of a queued job and its result once finished"""
+    if API_KEY and x_api_key != API_KEY:
+        raise HTTPException(status_code=401, detail="Invalid API Key")
+
+    job = _get_job_queue().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    return {
+        "job_id": job["id"],
+        "status": job["status"],
+        "attempts": job["attempts"],
+        "worker_id": job["worker_id"],
+        "result": job["result"],
+        "error": job["error"]
+    }
+
+
+@app.api_route("/download/{filename}", methods=["GET", "HEAD"])
+async def download_file(filename: str, request: Request):
+    """Download processed video file with range and conditional GET support"""
     file_path = os.path.join(OUTPUT_DIR, filename)
-    if not os.path.exists(file_path):
+    if not os.path.isfile(file_path):
+        raise HTTPException(status_code=404, detail="File not found")
+
+    return await file_response(request, file_path, 'video/mp4', filename=filename)
+
+
+STREAM_ID_PATTERN = re.compile(r"[A-Za-z0-9_-][A-Za-z0-9._-]*")
+
+STREAM_MEDIA_TYPES = {
+    ".m3u8": "application/vnd.apple.mpegurl",
+    ".mpd": "application/dash+xml",
+    ".ts": "video/mp2t",
+    ".m4s": "video/iso.segment",
+    ".mp4": "video/mp4",
+}
+
+
+@app.api_route("/stream/{stream_id}/{asset_path:path}", methods=["GET", "HEAD"])
+async def stream_file(stream_id: str, asset_path: str, request: Request):
+    """Serve adaptive-streaming playlists and segments"""
+    # Stream ids are generated ids or output stems; anything else (e.g. "..")
+    # could point stream_root outside STREAM_DIR
+    if not STREAM_ID_PATTERN.fullmatch(stream_id):
         raise HTTPException(status_code=404, detail="File not found")
 
-    return FileResponse(
-        path=file_path,
-        filename=filename,
-        media_type='video/mp4'
-    )
+    streams_dir = os.path.realpath(STREAM_DIR)
+    stream_root = os.path.realpath(os.path.join(streams_dir, stream_id))
+    file_path = os.path.realpath(os.path.join(stream_root, asset_path))
+
+    # Reject traversal outside the stream directory
+    if (not stream_root.startswith(streams_dir + os.sep)
+            or not file_path.startswith(stream_root + os.sep)
+            or not os.path.isfile(file_path)):
+        raise HTTPException(status_code=404, detail="File not found")
+
+    extension = os.path.splitext(file_path)[1].lower()
+    if extension in (".m3u8", ".mpd"):
+        # VOD manifests do not change, but keep them short-lived so a
+        # re-packaged stream is picked up quickly
+        cache_control = "public, max-age=60"
+    else:
+        # Segment names are unique per stream, so they never change
+        cache_control = "public, max-age=31536000, immutable"
+
+    return await file_response(
+        request, file_path,
+        STREAM_MEDIA_TYPES.get(extension, "application/octet-stream"),
+        cache_control=cache_control)
 
 
 @app.get("/health")
@@ -1,128 +1,257 @@
 import subprocess
 import os
 from pathlib import Path
+import render_cache
+import encoder_tuning
+from keyframe_index import discard_index
+from profiler import JobProfile, stage
+from workspace import JobWorkspace, current_workspace
+from config import (
+    RENDER_CACHE_ENABLED, ABR_LADDER, ABR_SEGMENT_SECONDS, STREAM_DIR,
+    PROFILE_DIR, PROFILE_SAVE, COLOR_LUT_ENABLED, FFMPEG_BACKEND
+)
 from ffmpeg_utils import (
     ffmpeg_trim, ffmpeg_adjust_contrast, ffmpeg_adjust_brightness,
-    validate_audio_present, ffmpeg_cut_section, get_video_duration,
+    validate_audio_present, ffmpeg_cut_section, ffmpeg_cut_ranges,
+    get_video_duration,
     ffmpeg_adjust_saturation, ffmpeg_adjust_hue, ffmpeg_adjust_gamma,
     ffmpeg_apply_blur, ffmpeg_apply_sharpen, ffmpeg_adjust_speed,
     ffmpeg_rotate_video, ffmpeg_flip_video, ffmpeg_crop_video,
-    ffmpeg_scale_video, ffmpeg_adjust_volume
+    ffmpeg_scale_video, ffmpeg_adjust_volume, ffmpeg_package_adaptive,
+    get_video_resolution, ffmpeg_apply_lut
 )
 
+try:
+    import color_lut
+except ImportError:  # numpy not installed - color actions run one by one
+    color_lut = None
+
+
+def _can_fold_colors():
+    return (COLOR_LUT_ENABLED and color_lut is not None
+            and encoder_tuning.has_filter("lut3d"))
+
+
+def _render_variant():
+    """Settings besides the action list that change what a render produces"""
+    return {
+        "backend": FFMPEG_BACKEND,
+        "color_lut": _can_fold_colors(),
+        "encoder": encoder_tuning.settings()
+    }
+
+
+def _plan_steps(all_actions, start):
+    """
+    Yield (index, action) for the actions from ``start`` on.
+
+    Runs of two or more consecutive color actions are folded into a single
+    "color_grade" step rendered through one 3D LUT; its index is the last
+    action of the run, so temp naming and cache keys line up with it.
+    """
+    fold = _can_fold_colors()
+    i = start
+    while i < len(all_actions):
+        end = i
+        if fold:
+            while (end < len(all_actions)
+                   and all_actions[end].get("action") in color_lut.COLOR_ACTIONS):
+                end += 1
+        if end - i >= 2:
+            yield end - 1, {"action": "color_grade", "actions": all_actions[i:end]}
+            i = end
+        else:
+            yield i, all_actions[i]
+            i += 1
+
+
+
+def _apply_action(act, input_path, output_path):
+    """Run a single action; returns the rendered path, or None if it was skipped"""
+    action = act.get("action", "")
+    value = act.get("value", 0)  # Default to 0 if no value provided
+
+    if action == "trim":
+        return ffmpeg_trim(input_path, output_path, value)
+
+    elif action == "adjust_contrast":
+        return ffmpeg_adjust_contrast(
+            input_path, output_path, value)
+
+    elif action == "brightness":
+        return ffmpeg_adjust_brightness(
+            input_path, output_path, value)
+
+    elif action == "saturation":
+        return ffmpeg_adjust_saturation(
+            input_path, output_path, value)
+
+    elif action == "hue":
+        return ffmpeg_adjust_hue(
+            input_path, output_path, value)
+
+    elif action == "gamma":
+        return ffmpeg_adjust_gamma(
+            input_path, output_path, value)
+
+    elif action == "blur":
+        return ffmpeg_apply_blur(
+            input_path, output_path, value)
+
+    elif action == "sharpen":
+        return ffmpeg_apply_sharpen(
+            input_path, output_path, value)
+
+    elif action == "speed":
+        return ffmpeg_adjust_speed(
+            input_path, output_path, value)
+
+    elif action == "rotate":
+        return ffmpeg_rotate_video(
+            input_path, output_path, value)
+
+    elif action == "flip":
+        direction = act.get("direction", "horizontal")
+        return ffmpeg_flip_video(
+            input_path, output_path, direction)
+
+    elif action == "crop":
+        x = act.get("x", 0)
+        y = act.get("y", 0)
+        width = act.get("width", 640)
+        height = act.get("height", 480)
+        return ffmpeg_crop_video(
+            input_path, output_path, x, y, width, height)
+
+    elif action == "scale":
+        width = act.get("width", 1920)
+        height = act.get("height", 1080)
+        return ffmpeg_scale_video(
+            input_path, output_path, width, height)
+
+    elif action == "volume":
+        return ffmpeg_adjust_volume(
+            input_path, output_path, value)
+
+    elif action == "color_grade":
+        # Folded run of color actions (see _plan_steps)
+        names = ", ".join(a.get("action") for a in act["actions"])
+        print(f"🎨 Applying {names} as a single LUT pass")
+        lut_path = color_lut.get_lut_file(act["actions"])
+        return ffmpeg_apply_lut(input_path, output_path, lut_path)
+
+    elif action == "cut_section":
+        # For cut_section, start_time and end_time are required
+        start_time = act.get("start_time")
+        end_time = act.get("end_time")
+
+        if start_time is None or end_time is None:
+            print(f"❌ cut_section requires both start_time and end_time")
+            print(
+                f"   Received: start_time={start_time}, end_time={end_time}")
+            return None
+
+        return ffmpeg_cut_section(
+            input_path, output_path, start_time, end_time)
+
+    elif action == "cut_ranges":
+        # Remove (or keep) several intervals in a single pass
+        ranges = act.get("ranges")
+        if not ranges:
+            print(f"❌ cut_ranges requires a non-empty ranges list")
+            return None
+
+        return ffmpeg_cut_ranges(
+            input_path, output_path, ranges,
+            mode=act.get("mode", "remove"),
+            accurate=act.get("accurate", False))
 
-def process_video(input_path, actions, output_path):
-    """Process video with multiple actions while preserving audio throughout"""
+    else:
+        print(f"Unknown action: {action}")
+        return None
+
+
+def process_video(input_path, actions, output_path, report=None):
+    """
+    Process video with multiple actions while preserving audio throughout.
+
+    Intermediate renders are cached by (asset hash, action prefix), so a
+    request whose action list extends an earlier one only applies the new
+    suffix. If a ``report`` dict is given, it is filled with the number of
+    reused and total steps.
+
+    Intermediates live in the job workspace and the result is renamed onto
+    ``output_path`` only once it is complete.
+    """
+    workspace = current_workspace()
+    if workspace is None:
+        with JobWorkspace(Path(output_path).stem[:48]):
+            return process_video(input_path, actions, output_path, report)
 
     # Validate input has audio
-    input_has_audio = validate_audio_present(input_path)
+    with stage("input_audio_check"):
+        input_has_audio = validate_audio_present(input_path)
     print(
         f"Input video audio status: {'Present' if input_has_audio else 'Not present'}")
 
+    all_actions = actions.get("actions", [])
     temp_path = input_path
     temp_files = []  # Track temporary files for cleanup
 
+    cache_keys = []
+    reused_steps = 0
+    if RENDER_CACHE_ENABLED and all_actions:
+        with stage("cache_lookup"):
+            cache_keys = render_cache.prefix_keys(
+                render_cache.hash_asset(input_path), all_actions,
+                suffix=Path(output_path).suffix or ".mp4",
+                variant=_render_variant())
+            reused_steps, cached_path = render_cache.lookup(
+                cache_keys, pin_dir=workspace.path)
+        if cached_path:
+            print(
+                f"♻️  Reusing cached render for {reused_steps}/{len(all_actions)} steps")
+            temp_path = cached_path
+
+    if report is not None:
+        report["reused_steps"] = reused_steps
+        report["total_steps"] = len(all_actions)
+
+    if reused_steps and reused_steps == len(all_actions):
+        # Whole action list already rendered - just materialize the output
+        with stage("cache_materialize"):
+            workspace.publish(temp_path, output_path)
+        return output_path
+
     try:
-        for i, act in enumerate(actions.get("actions", [])):
+        for i, act in _plan_steps(all_actions, reused_steps):
+            workspace.check_cancelled()
             action = act.get("action", "")
             value = act.get("value", 0)  # Default to 0 if no value provided
             unit = act.get("unit", "")
 
-            # Create unique temporary filename for each step
-            temp_output = None
-            if i < len(actions.get("actions", [])) - 1:  # Not the last action
-                temp_dir = Path(output_path).parent
-                temp_output = temp_dir / \
-                    f"temp_step_{i}_{Path(input_path).stem}.mp4"
-                temp_files.append(str(temp_output))
-            else:
-                temp_output = output_path
+            # Create unique temporary filename for each step; the last one
+            # is published to output_path after the loop
+            temp_output = workspace.file(
+                f"step_{i}{Path(output_path).suffix or '.mp4'}")
+            if i < len(all_actions) - 1:  # Not the last action
+                temp_files.append(temp_output)
 
             print(f"Processing action: {action} with value: {value}")
-
-            if action == "trim":
-                temp_path = ffmpeg_trim(temp_path, str(temp_output), value)
-
-            elif action == "adjust_contrast":
-                temp_path = ffmpeg_adjust_contrast(
-                    temp_path, str(temp_output), value)
-
-            elif action == "brightness":
-                temp_path = ffmpeg_adjust_brightness(
-                    temp_path, str(temp_output), value)
-
-            elif action == "saturation":
-                temp_path = ffmpeg_adjust_saturation(
-                    temp_path, str(temp_output), value)
-
-            elif action == "hue":
-                temp_path = ffmpeg_adjust_hue(
-                    temp_path, str(temp_output), value)
-
-            elif action == "gamma":
-                temp_path = ffmpeg_adjust_gamma(
-                    temp_path, str(temp_output), value)
-
-            elif action == "blur":
-                temp_path = ffmpeg_apply_blur(
-                    temp_path, str(temp_output), value)
-
-            elif action == "sharpen":
-                temp_path = ffmpeg_apply_sharpen(
-                    temp_path, str(temp_output), value)
-
-            elif action == "speed":
-                temp_path = ffmpeg_adjust_speed(
-                    temp_path, str(temp_output), value)
-
-            elif action == "rotate":
-                temp_path = ffmpeg_rotate_video(
-                    temp_path, str(temp_output), value)
-
-            elif action == "flip":
-                direction = act.get("direction", "horizontal")
-                temp_path = ffmpeg_flip_video(
-                    temp_path, str(temp_output), direction)
-
-            elif action == "crop":
-                x = act.get("x", 0)
-                y = act.get("y", 0)
-                width = act.get("width", 640)
-                height = act.get("height", 480)
-                temp_path = ffmpeg_crop_video(
-                    temp_path, str(temp_output), x, y, width, height)
-
-            elif action == "scale":
-                width = act.get("width", 1920)
-                height = act.get("height", 1080)
-                temp_path = ffmpeg_scale_video(
-                    temp_path, str(temp_output), width, height)
-
-            elif action == "volume":
-                temp_path = ffmpeg_adjust_volume(
-                    temp_path, str(temp_output), value)
-
-            elif action == "cut_section":
-                # For cut_section, start_time and end_time are required
-                start_time = act.get("start_time")
-                end_time = act.get("end_time")
-
-                if start_time is None or end_time is None:
-                    print(f"❌ cut_section requires both start_time and end_time")
-                    print(
-                        f"   Received: start_time={start_time}, end_time={end_time}")
-                    continue
-
-                temp_path = ffmpeg_cut_section(
-                    temp_path, str(temp_output), start_time, end_time)
-
-            else:
-                print(f"Unknown action: {action}")
+            with stage(f"step_{i}_{action}"):
+                result_path = _apply_action(act, temp_path, str(temp_output))
+            if result_path is None:
                 continue
+            temp_path = result_path
+
+            if cache_keys:
+                with stage(f"step_{i}_cache_store"):
+                    render_cache.store(cache_keys[i], temp_path)
 
             # Verify audio is still present after each step
             if input_has_audio:
-                audio_present = validate_audio_present(temp_path)
+                with stage(f"step_{i}_audio_check"):
+                    audio_present = validate_audio_present(temp_path)
                 print(
                     f"After {action}: Audio {'preserved' if audio_present else 'LOST!'}")
 
@@ -136,20 +265,28 @@ def process_video(input_path, actions, output_path):
         for temp_file in temp_files:
             if os.path.exists(temp_file):
                 os.remove(temp_file)
+            discard_index(temp_file)
         raise
 
     finally:
         # Cleanup temporary files
-        for temp_file in temp_files:
-            if os.path.exists(temp_file) and temp_file != temp_path:
-                try:
-                    os.remove(temp_file)
-                except:
-                    pass  # Ignore cleanup errors
+        with stage("cleanup"):
+            for temp_file in temp_files:
+                if os.path.exists(temp_file) and temp_file != temp_path:
+                    try:
+                        os.remove(temp_file)
+                    except:
+                        pass  # Ignore cleanup errors
+                    discard_index(temp_file)
+
+    with stage("publish"):
+        # Atomic rename; copies first if the last step was skipped
+        workspace.publish(temp_path, output_path)
 
     # Final validation
     if input_has_audio:
-        final_audio = validate_audio_present(output_path)
+        with stage("output_audio_check"):
+            final_audio = validate_audio_present(output_path)
         print(
             f"Final output audio status: {'Present' if final_audio else 'MISSING!'}")
 
@@ -157,3 +294,105 @@ def process_video(input_path, actions, output_path):
             print("WARNING: Audio was lost during processing!")
 
     return output_path
+
+
+def package_adaptive(video_path, output_dir, fmt="hls"):
+    """Package a finished render as an HLS/DASH ladder sized to the source"""
+
+    resolution = get_video_resolution(video_path)
+    source_height = resolution[1] if resolution else None
+
+    # Never upscale: keep rungs at or below the source height, but always
+    # emit at least the smallest rung so tiny sources still get a stream
+    ladder = sorted(ABR_LADDER, key=lambda r: r["height"], reverse=True)
+    renditions = [r for r in ladder
+                  if source_height is None or r["height"] <= source_height]
+    if not renditions:
+        renditions = ladder[-1:]
+
+    manifest = ffmpeg_package_adaptive(
+        video_path, output_dir, renditions,
+        has_audio=validate_audio_present(video_path),
+        fmt=fmt, segment_seconds=ABR_SEGMENT_SECONDS)
+
+    return manifest, renditions
+
+
+def run_edit_job(input_path, actions, output_path, output_format="mp4",
+                 stream_id=None, profile=False, upload_wall_s=None,
+                 cancel=None):
+    """
+    Render an edit job and build the API response describing the result.
+
+    With ``profile=True`` every stage is timed, FFmpeg children are measured
+    (CPU, peak RSS, block I/O, -benchmark output) and the trace is returned
+    under ``profile`` and, if PROFILE_SAVE is set, written to PROFILE_DIR.
+    ``upload_wall_s`` is the time from the request's arrival on the API node
+    until the upload was stored, including the body transfer.
+
+    All intermediates go to a private JobWorkspace, and outputs are only
+    renamed into OUTPUT_DIR/STREAM_DIR once complete, so concurrent jobs
+    can share those directories safely. Setting the ``cancel`` event stops
+    the job at the next step with JobCancelled, before anything is published.
+    """
+    workspace = JobWorkspace((stream_id or Path(output_path).stem)[:48], cancel)
+    if not profile:
+        with workspace:
+            return _run_edit_job(input_path, actions, output_path,
+                                 output_format, stream_id)
+
+    job_profile = JobProfile(stream_id or Path(output_path).stem)
+    if upload_wall_s is not None:
+        job_profile.add_stage("upload", upload_wall_s)
+    with job_profile, workspace:
+        response = _run_edit_job(input_path, actions, output_path,
+                                 output_format, stream_id)
+    response["profile"] = job_profile.to_dict()
+    if PROFILE_SAVE:
+        response["profile_path"] = job_profile.save(PROFILE_DIR)
+    return response
+
+
+def _run_edit_job(input_path, actions, output_path, output_format, stream_id):
+    with stage("job_input_audio_check"):
+        input_has_audio = validate_audio_present(input_path)
+    print(
+        f"Input video '{os.path.basename(input_path)}' audio: {'Present' if input_has_audio else 'Not present'}")
+
+    cache_report = {}
+    process_video(input_path, actions, output_path, report=cache_report)
+
+    # Verify audio preservation
+    with stage("job_output_audio_check"):
+        output_has_audio = validate_audio_present(output_path)
+    audio_status = "preserved" if (
+        input_has_audio and output_has_audio) else "lost" if input_has_audio else "none"
+
+    response = {
+        "status": "success",
+        "output": output_path,
+        "audio_status": audio_status,
+        "input_had_audio": input_has_audio,
+        "output_has_audio": output_has_audio,
+        "filename": os.path.basename(output_path),
+        "reused_steps": cache_report.get("reused_steps", 0),
+        "total_steps": cache_report.get("total_steps", 0)
+    }
+
+    if output_format != "mp4":
+        stream_id = stream_id or Path(output_path).stem
+        workspace = current_workspace()
+        with stage("package_adaptive"):
+            stream_dir = workspace.file("stream")
+            manifest, renditions = package_adaptive(
+                output_path, stream_dir, output_format)
+            workspace.publish(stream_dir, os.path.join(STREAM_DIR, stream_id))
+        response["stream"] = {
+            "format": output_format,
+            "id": stream_id,
+            "manifest_url": f"/stream/{stream_id}/{os.path.basename(manifest)}",
+            "hls_url": f"/stream/{stream_id}/master.m3u8",
+            "renditions": [r["height"] for r in renditions]
+        }
+
+    return response
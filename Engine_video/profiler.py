@@ -0,0 +1,185 @@
+"""
+Opt-in per-job profiling.
+
+While a JobProfile is active (``with JobProfile(...)``), every FFmpeg/FFprobe
+child started through :func:`run_command` is reaped with ``os.wait4`` so its
+own CPU time, peak RSS and block I/O are attributed to the current stage.
+When no profile is active, :func:`run_command` is a plain ``subprocess.run``.
+"""
+import contextvars
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+
+# ru_maxrss is kilobytes on Linux but bytes on macOS
+_MAXRSS_TO_KB = 1 / 1024 if sys.platform == "darwin" else 1
+# ru_inblock/ru_oublock count 512-byte blocks
+_BLOCK_SIZE = 512
+
+_current_profile = contextvars.ContextVar("current_profile", default=None)
+
+
+def current_profile():
+    return _current_profile.get()
+
+
+class JobProfile:
+    """Structured trace of one job: a list of named stages with child stats"""
+
+    def __init__(self, job_id):
+        self.job_id = job_id
+        self.stages = []
+        self._stack = []
+        self._start = None
+        self._token = None
+        self.total_wall_s = None
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        self._token = _current_profile.set(self)
+        return self
+
+    def __exit__(self, *exc):
+        self.total_wall_s = time.perf_counter() - self._start
+        _current_profile.reset(self._token)
+        return False
+
+    @contextmanager
+    def stage(self, name):
+        record = {"name": name, "wall_s": 0.0, "engine_cpu_s": 0.0,
+                  "children": []}
+        self.stages.append(record)
+        self._stack.append(record)
+        wall_start = time.perf_counter()
+        cpu_start = time.thread_time()
+        try:
+            yield record
+        finally:
+            record["wall_s"] = time.perf_counter() - wall_start
+            record["engine_cpu_s"] = time.thread_time() - cpu_start
+            self._stack.pop()
+
+    def add_stage(self, name, wall_s):
+        """Record a stage that was timed outside this profile"""
+        self.stages.append({"name": name, "wall_s": wall_s,
+                            "engine_cpu_s": None, "children": []})
+
+    def record_child(self, child):
+        if self._stack:
+            self._stack[-1]["children"].append(child)
+        else:
+            # Children started outside a named stage still need to show up
+            self.add_stage("unattributed", child["wall_s"])
+            self.stages[-1]["children"].append(child)
+
+    def to_dict(self):
+        stages = []
+        for stage in self.stages:
+            children = stage["children"]
+            summary = dict(stage)
+            summary["child_user_cpu_s"] = sum(c.get("user_cpu_s", 0) for c in children)
+            summary["child_sys_cpu_s"] = sum(c.get("sys_cpu_s", 0) for c in children)
+            summary["child_max_rss_kb"] = max(
+                (c.get("max_rss_kb", 0) for c in children), default=0)
+            summary["child_block_read_bytes"] = sum(
+                c.get("block_read_bytes", 0) for c in children)
+            summary["child_block_write_bytes"] = sum(
+                c.get("block_write_bytes", 0) for c in children)
+            stages.append(summary)
+
+        return {
+            "job_id": self.job_id,
+            "total_wall_s": self.total_wall_s,
+            "stages": stages
+        }
+
+    def save(self, directory):
+        """Write the trace as JSON for offline analysis and return its path"""
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"profile_{self.job_id}.json")
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, indent=2)
+        return path
+
+
+@contextmanager
+def stage(name):
+    """Time a stage of the current profile; a no-op when profiling is off"""
+    profile = current_profile()
+    if profile is None:
+        yield None
+        return
+    with profile.stage(name) as record:
+        yield record
+
+
+def _parse_benchmark(stderr):
+    """Extract FFmpeg -benchmark lines ("bench: utime=0.1s ...") into a dict"""
+    bench = {}
+    for line in stderr.splitlines():
+        if not line.startswith("bench:"):
+            continue
+        for field in line[len("bench:"):].split():
+            key, _, value = field.partition("=")
+            if value:
+                bench[key] = value
+    return bench
+
+
+def _run_and_reap(cmd, text):
+    """Like subprocess.run(check=True, capture_output=True), but returns rusage"""
+    process = subprocess.Popen(
+        cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=text)
+
+    # Drain stderr on a thread so neither pipe can fill and block the child.
+    # communicate() would reap the child itself and discard its rusage.
+    stderr_chunks = []
+    reader = threading.Thread(
+        target=lambda: stderr_chunks.append(process.stderr.read()), daemon=True)
+    reader.start()
+    stdout = process.stdout.read()
+    reader.join()
+    process.stdout.close()
+    process.stderr.close()
+
+    _, status, usage = os.wait4(process.pid, 0)
+    process.returncode = os.waitstatus_to_exitcode(status)
+    stderr = stderr_chunks[0] if stderr_chunks else ("" if text else b"")
+    return subprocess.CompletedProcess(cmd, process.returncode, stdout, stderr), usage
+
+
+def run_command(cmd, text=False):
+    """Run a child process with check=True/capture_output=True semantics"""
+    profile = current_profile()
+    if profile is None or not hasattr(os, "wait4"):
+        return subprocess.run(cmd, check=True, capture_output=True, text=text)
+
+    start = time.perf_counter()
+    result, usage = _run_and_reap(cmd, text)
+    stderr = result.stderr if text else result.stderr.decode(errors="replace")
+
+    child = {
+        "cmd": os.path.basename(str(cmd[0])),
+        "args": [str(part) for part in cmd[1:]],
+        "exit_code": result.returncode,
+        "wall_s": time.perf_counter() - start,
+        "user_cpu_s": usage.ru_utime,
+        "sys_cpu_s": usage.ru_stime,
+        "max_rss_kb": int(usage.ru_maxrss * _MAXRSS_TO_KB),
+        "block_read_bytes": usage.ru_inblock * _BLOCK_SIZE,
+        "block_write_bytes": usage.ru_oublock * _BLOCK_SIZE,
+    }
+    benchmark = _parse_benchmark(stderr)
+    if benchmark:
+        child["benchmark"] = benchmark
+    profile.record_child(child)
+
+    if result.returncode != 0:
+        raise subprocess.CalledProcessError(
+            result.returncode, cmd, result.stdout, result.stderr)
+    return result
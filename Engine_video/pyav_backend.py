@@ -0,0 +1,208 @@
+"""
+In-process libav backend built on PyAV.
+
+The subprocess backend pays for a process spawn, a fresh demux and a probe on
+every step. This backend opens the input once, runs decoded frames through an
+in-memory filter graph and encodes them in the same process. Select it with
+FFMPEG_BACKEND=pyav after installing the optional ``av`` package.
+
+PyAV's wheels bundle an LGPL libav build without GPL filters such as ``eq``;
+chains that need one are handed to the ``fallback`` backend instead.
+"""
+import av
+from av.filter import Graph
+
+import encoder_tuning
+
+
+def _split_chain(filter_chain):
+    """Split "eq=contrast=1.2,hflip" into [("eq", "contrast=1.2"), ("hflip", None)]"""
+    # Commas inside single quotes belong to an expression, e.g. select='between(t,1,2)'
+    specs, current, quoted = [], [], False
+    for char in filter_chain:
+        if char == "'":
+            quoted = not quoted
+        if char == "," and not quoted:
+            specs.append("".join(current))
+            current = []
+        else:
+            current.append(char)
+    specs.append("".join(current))
+
+    filters = []
+    for spec in specs:
+        name, _, args = spec.strip().partition("=")
+        filters.append((name, args or None))
+    return filters
+
+
+def _build_graph(template, filter_chain, audio=False):
+    graph = Graph()
+    if audio:
+        source = graph.add_abuffer(template=template)
+        sink_name = "abuffersink"
+    else:
+        source = graph.add_buffer(template=template)
+        sink_name = "buffersink"
+
+    node = source
+    for name, args in _split_chain(filter_chain):
+        next_node = graph.add(name, args)
+        node.link_to(next_node)
+        node = next_node
+
+    sink = graph.add(sink_name)
+    node.link_to(sink)
+    graph.configure()
+    return graph
+
+
+def _drain(graph):
+    """Yield every frame currently buffered at the graph's sink"""
+    while True:
+        try:
+            yield graph.pull()
+        except (BlockingIOError, av.error.EOFError):
+            return
+
+
+def _copy_stream(container, template):
+    # PyAV 14 renamed template-based stream creation
+    if hasattr(container, "add_stream_from_template"):
+        return container.add_stream_from_template(template)
+    return container.add_stream(template=template)
+
+
+class _DeferredMuxer:
+    """
+    Holds packets back until every encoder knows its frame size.
+
+    The container header is written on the first mux, so nothing may be
+    muxed before the filtered video stream has seen its first frame.
+    """
+
+    def __init__(self, output, filtered):
+        self.output = output
+        self.filtered = filtered
+        self.pending = []
+
+    def mux(self, packets):
+        if not isinstance(packets, list):
+            packets = [packets]
+        if not all(stream.sized for stream in self.filtered):
+            self.pending.extend(packets)
+            return
+        if self.pending:
+            packets = self.pending + packets
+            self.pending = []
+        self.output.mux(packets)
+
+    def close(self):
+        if self.pending:
+            self.output.mux(self.pending)
+            self.pending = []
+
+
+class _FilteredStream:
+    """Decoded input stream -> filter graph -> encoder for one output stream"""
+
+    def __init__(self, output, in_stream, filter_chain, audio):
+        self.in_stream = in_stream
+        self.graph = _build_graph(in_stream, filter_chain, audio=audio)
+        self.audio = audio
+        if audio:
+            self.out_stream = output.add_stream(
+                "aac", rate=in_stream.rate, layout=in_stream.layout.name)
+        else:
+            self.out_stream = output.add_stream(
+                encoder_tuning.video_encoder(), rate=in_stream.average_rate or 30)
+            tuned = encoder_tuning.encoder_args(in_stream.codec_context.height)
+            self.out_stream.options = {
+                option.lstrip("-"): value for option, value in zip(tuned[::2], tuned[1::2])}
+            self.out_stream.pix_fmt = "yuv420p"
+            self.out_stream.time_base = in_stream.time_base
+            # Encode in the input time base too; at 1/rate, retimed frames
+            # (e.g. setpts for speed changes) round onto duplicate timestamps
+            self.out_stream.codec_context.time_base = in_stream.time_base
+        self.sized = audio
+
+    def _encode(self, muxer, frames):
+        for frame in frames:
+            if not self.sized:
+                # Filters such as crop/scale/rotate decide the output size
+                self.out_stream.width = frame.width
+                self.out_stream.height = frame.height
+                self.sized = True
+            muxer.mux(self.out_stream.encode(frame))
+
+    def push(self, muxer, frame):
+        self.graph.push(frame)
+        self._encode(muxer, _drain(self.graph))
+
+    def flush(self, muxer):
+        self.graph.push(None)
+        self._encode(muxer, _drain(self.graph))
+        muxer.mux(self.out_stream.encode(None))
+
+
+def _missing_filters(*filter_chains):
+    return sorted({name for chain in filter_chains if chain
+                   for name, _ in _split_chain(chain)
+                   if name not in av.filter.filters_available})
+
+
+class PyAVBackend:
+    """Decodes, filters and encodes in-process with libav via PyAV"""
+
+    name = "pyav"
+
+    def __init__(self, fallback=None):
+        self.fallback = fallback
+        self._warned = set()
+
+    def transcode(self, input_path, output_path, video_filter=None, audio_filter=None):
+        """Apply a video and/or audio filter chain, copying untouched streams"""
+        missing = _missing_filters(video_filter, audio_filter)
+        if missing and self.fallback is not None:
+            if not self._warned.issuperset(missing):
+                self._warned.update(missing)
+                print(f"⚠️  PyAV's libav lacks {', '.join(missing)} - "
+                      f"using the {self.fallback.name} backend for these filters")
+            return self.fallback.transcode(input_path, output_path,
+                                           video_filter=video_filter,
+                                           audio_filter=audio_filter)
+
+        with av.open(str(input_path)) as source, av.open(str(output_path), "w") as output:
+            in_video = source.streams.video[0] if source.streams.video else None
+            in_audio = source.streams.audio[0] if source.streams.audio else None
+
+            filtered = {}
+            copied = {}
+            for in_stream, filter_chain, audio in (
+                    (in_video, video_filter, False), (in_audio, audio_filter, True)):
+                if in_stream is None:
+                    continue
+                if filter_chain:
+                    in_stream.thread_type = "AUTO"
+                    filtered[in_stream.index] = _FilteredStream(
+                        output, in_stream, filter_chain, audio)
+                else:
+                    copied[in_stream.index] = _copy_stream(output, in_stream)
+
+            muxer = _DeferredMuxer(output, list(filtered.values()))
+            streams = [s for s in (in_video, in_audio) if s is not None]
+            for packet in source.demux(streams):
+                index = packet.stream.index
+                if index in copied:
+                    # Flush packets carry no data and must not be muxed
+                    if packet.dts is None:
+                        continue
+                    packet.stream = copied[index]
+                    muxer.mux(packet)
+                else:
+                    for frame in packet.decode():
+                        filtered[index].push(muxer, frame)
+
+            for stream in filtered.values():
+                stream.flush(muxer)
+            muxer.close()
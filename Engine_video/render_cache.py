@@ -0,0 +1,173 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+import threading
+import uuid
+from pathlib import Path
+
+from config import CACHE_DIR, RENDER_CACHE_MAX_BYTES
+from keyframe_index import discard_index
+
+
+_HASH_CHUNK_SIZE = 1024 * 1024
+# Bump when a code change alters what a given action list renders to
+_CACHE_VERSION = 2
+# Entries are "<sha256><suffix>"; CACHE_DIR also holds LUTs, tuning and indexes
+_ENTRY_PATTERN = re.compile(r"[0-9a-f]{64}\.\w+")
+_evict_lock = threading.Lock()
+
+
+def hash_asset(path):
+    """Return the SHA-256 hex digest of a source file's contents"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(_HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def prefix_keys(asset_hash, actions, suffix=".mp4", variant=None):
+    """
+    Build one cache key per action prefix.
+
+    keys[k] identifies the render of actions[:k + 1] applied to the asset.
+    Actions are serialized with sorted keys so that equivalent JSON objects
+    produced by the client in a different field order still hit the cache.
+    The digest is seeded with the cache version, the container ``suffix``
+    (which is also the entry's extension) and ``variant``, a JSON-able
+    description of whatever else shapes the output (backend, encoder
+    settings, ...), so changing any of them never serves a stale render.
+    """
+    seed = json.dumps({"version": _CACHE_VERSION, "asset": asset_hash,
+                       "suffix": suffix, "variant": variant}, sort_keys=True)
+    keys = []
+    digest = hashlib.sha256(seed.encode())
+    for act in actions:
+        digest.update(json.dumps(act, sort_keys=True).encode())
+        digest.update(b"\n")
+        keys.append(f"{digest.copy().hexdigest()}{suffix}")
+    return keys
+
+
+def _entry_path(key):
+    return Path(CACHE_DIR) / key
+
+
+def _stamp_path(entry):
+    # Recency lives in a separate stamp file: entries may be hard links of
+    # published outputs, whose mtime (Last-Modified) must never change
+    return entry.with_suffix(".used")
+
+
+def _mark_used(entry):
+    try:
+        _stamp_path(entry).touch()
+    except OSError:
+        pass
+
+
+def _pin(entry, pin_dir):
+    """Link (or copy) an entry into pin_dir so eviction cannot remove it under us"""
+    pinned = Path(pin_dir) / f"cached_{uuid.uuid4().hex[:8]}{entry.suffix}"
+    try:
+        os.link(entry, pinned)
+    except FileNotFoundError:
+        raise
+    except OSError:
+        shutil.copyfile(entry, pinned)
+    return pinned
+
+
+def lookup(keys, pin_dir=None):
+    """
+    Find the longest cached prefix.
+
+    Returns (steps, path) where steps is the number of leading actions whose
+    result is already cached, or (0, None) on a miss. With ``pin_dir`` the
+    returned path is a private link in that directory, so another worker
+    evicting the entry cannot break the job; an entry evicted before it
+    could be pinned falls back to the next shorter prefix.
+    """
+    for steps in range(len(keys), 0, -1):
+        entry = _entry_path(keys[steps - 1])
+        if not entry.is_file():
+            continue
+        try:
+            path = _pin(entry, pin_dir) if pin_dir else entry
+        except FileNotFoundError:
+            continue
+        _mark_used(entry)
+        return steps, str(path)
+    return 0, None
+
+
+def store(key, source_path):
+    """Add a rendered intermediate to the cache and evict old entries"""
+    try:
+        size = os.path.getsize(source_path)
+    except OSError:
+        return None
+
+    if size > RENDER_CACHE_MAX_BYTES:
+        return None
+
+    entry = _entry_path(key)
+    if entry.exists():
+        _mark_used(entry)
+        return str(entry)
+
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    tmp_entry = entry.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        try:
+            # Hard links avoid copying when cache and outputs share a volume
+            os.link(source_path, tmp_entry)
+        except OSError:
+            shutil.copyfile(source_path, tmp_entry)
+        os.replace(tmp_entry, entry)
+        _mark_used(entry)
+    except OSError as e:
+        print(f"⚠️  Could not cache render step: {e}")
+        if tmp_entry.exists():
+            tmp_entry.unlink()
+        return None
+
+    evict(RENDER_CACHE_MAX_BYTES)
+    return str(entry)
+
+
+def evict(max_bytes):
+    """Delete least recently used entries until the cache fits in max_bytes"""
+    with _evict_lock:
+        entries = []
+        total = 0
+        for entry in Path(CACHE_DIR).iterdir():
+            if not _ENTRY_PATTERN.fullmatch(entry.name):
+                continue
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            try:
+                used = _stamp_path(entry).stat().st_mtime
+            except OSError:
+                used = stat.st_mtime
+            entries.append((used, stat.st_size, entry))
+            total += stat.st_size
+
+        entries.sort()
+        for _, size, entry in entries:
+            if total <= max_bytes:
+                break
+            try:
+                entry.unlink()
+                total -= size
+            except OSError:
+                continue
+            try:
+                _stamp_path(entry).unlink()
+            except OSError:
+                pass
+            discard_index(str(entry))
@@ -0,0 +1,277 @@
+"""
+Resumable, parallel chunked uploads (tus-style).
+
+A session preallocates ``<INPUT_DIR>/<asset>.part`` at its final size. Each
+chunk is written straight to its offset, and once its checksum verifies a
+marker file ``<offset>-<length>`` is dropped in the session directory, so
+concurrent chunk requests never contend on shared state. Finalizing renames
+the part file to the asset name in INPUT_DIR; no bytes are copied.
+"""
+import base64
+import hashlib
+import json
+import os
+import shutil
+import time
+import uuid
+
+import anyio
+
+from config import (
+    INPUT_DIR, UPLOAD_SESSION_DIR, UPLOAD_MAX_CHUNK_BYTES, UPLOAD_SESSION_TTL_SECONDS
+)
+from ffmpeg_utils import safe_filename
+
+
+SUPPORTED_CHECKSUMS = ("sha256", "sha1", "md5")
+# Request bodies arrive in small pieces; batch them so each thread hop
+# writes and hashes a meaningful amount
+_WRITE_BATCH_BYTES = 1024 * 1024
+_sync = getattr(os, "fdatasync", os.fsync)
+
+
+class ChecksumMismatch(ValueError):
+    pass
+
+
+def _session_dir(upload_id):
+    # Upload ids are generated hex; reject anything that could escape the dir
+    if not upload_id.isalnum():
+        raise LookupError("Unknown upload")
+    return os.path.join(UPLOAD_SESSION_DIR, upload_id)
+
+
+def _load_session(upload_id):
+    try:
+        with open(os.path.join(_session_dir(upload_id), "session.json")) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        raise LookupError("Unknown upload")
+
+
+def parse_checksum_header(header):
+    """Parse a tus "Upload-Checksum: <algorithm> <base64 digest>" header"""
+    if not header:
+        return None
+    algorithm, _, encoded = header.strip().partition(" ")
+    algorithm = algorithm.lower()
+    if algorithm not in SUPPORTED_CHECKSUMS:
+        raise ValueError(f"Unsupported checksum algorithm: {algorithm}")
+    try:
+        return algorithm, base64.b64decode(encoded, validate=True)
+    except ValueError:
+        raise ValueError("Checksum must be base64 encoded")
+
+
+def expire_sessions(max_age=UPLOAD_SESSION_TTL_SECONDS):
+    """Remove abandoned sessions and their preallocated .part files"""
+    try:
+        entries = list(os.scandir(UPLOAD_SESSION_DIR))
+    except FileNotFoundError:
+        return 0
+
+    expired = 0
+    now = time.time()
+    for entry in entries:
+        try:
+            # Every verified chunk adds a marker, bumping the directory mtime
+            if not entry.is_dir() or now - entry.stat().st_mtime < max_age:
+                continue
+            with open(os.path.join(entry.path, "session.json")) as f:
+                part_path = json.load(f).get("part_path")
+        except (OSError, ValueError):
+            part_path = None
+        if part_path:
+            try:
+                os.remove(part_path)
+            except FileNotFoundError:
+                pass
+        shutil.rmtree(entry.path, ignore_errors=True)
+        expired += 1
+
+    if expired:
+        print(f"🧹 Expired {expired} abandoned upload session(s)")
+    return expired
+
+
+def create_session(filename, size):
+    """Start an upload and preallocate its destination file"""
+    if size <= 0:
+        raise ValueError("Upload size must be positive")
+    expire_sessions()
+
+    upload_id = uuid.uuid4().hex
+    asset_name = f"input_{upload_id[:8]}_{safe_filename(filename or 'upload.mp4')}"
+    part_path = os.path.join(INPUT_DIR, f"{asset_name}.part")
+
+    os.makedirs(INPUT_DIR, exist_ok=True)
+    session_dir = _session_dir(upload_id)
+    os.makedirs(session_dir)
+
+    # Sparse on most filesystems, so this reserves nothing until written
+    with open(part_path, "wb") as f:
+        f.truncate(size)
+
+    session = {
+        "upload_id": upload_id,
+        "filename": filename,
+        "asset": asset_name,
+        "size": size,
+        "part_path": part_path,
+        "created_at": time.time()
+    }
+    with open(os.path.join(session_dir, "session.json"), "w") as f:
+        json.dump(session, f)
+    return session
+
+
+def _write_at(fd, offset, data):
+    view = memoryview(data)
+    while view:
+        if hasattr(os, "pwrite"):
+            written = os.pwrite(fd, view, offset)
+        else:  # Windows: this fd is private to the request, so seek is safe
+            os.lseek(fd, offset, os.SEEK_SET)
+            written = os.write(fd, view)
+        offset += written
+        view = view[written:]
+
+
+def _drop_markers(session_dir, start, end):
+    """Forget received ranges overlapping [start, end) before they are overwritten"""
+    for name in os.listdir(session_dir):
+        first, sep, length = name.partition("-")
+        if sep and first.isdigit() and length.isdigit():
+            if int(first) < end and start < int(first) + int(length):
+                try:
+                    os.remove(os.path.join(session_dir, name))
+                except FileNotFoundError:
+                    pass
+
+
+def _write_and_hash(fd, offset, data, digest, session_dir):
+    # A resend that fails verification must leave its range "missing", not
+    # marked as received over bytes it has already replaced
+    _drop_markers(session_dir, offset, offset + len(data))
+    _write_at(fd, offset, data)
+    if digest:
+        digest.update(data)
+
+
+async def write_chunk(upload_id, offset, stream, checksum=None):
+    """
+    Write a chunk read from an async byte stream at ``offset``.
+
+    The chunk only counts as received once it is fully written and, if a
+    checksum was given, verified. A mismatching chunk is left unmarked so
+    the client can simply resend it. Disk writes, hashing and the flush run
+    in worker threads so concurrent chunks never stall the event loop.
+    """
+    session = _load_session(upload_id)
+    size = session["size"]
+    if offset < 0 or offset >= size:
+        raise ValueError("Offset outside the upload")
+
+    digest = hashlib.new(checksum[0]) if checksum else None
+    session_dir = _session_dir(upload_id)
+    try:
+        fd = os.open(session["part_path"], os.O_WRONLY | getattr(os, "O_BINARY", 0))
+    except FileNotFoundError:
+        raise LookupError("Unknown upload")  # Finalized or expired meanwhile
+    length = 0
+    pending = bytearray()
+    try:
+        async for piece in stream:
+            if not piece:
+                continue
+            length += len(piece)
+            if length > UPLOAD_MAX_CHUNK_BYTES or offset + length > size:
+                raise ValueError("Chunk exceeds the allowed size")
+            pending += piece
+            if len(pending) >= _WRITE_BATCH_BYTES:
+                await anyio.to_thread.run_sync(
+                    _write_and_hash, fd, offset + length - len(pending),
+                    bytes(pending), digest, session_dir)
+                pending.clear()
+        if pending:
+            await anyio.to_thread.run_sync(
+                _write_and_hash, fd, offset + length - len(pending),
+                bytes(pending), digest, session_dir)
+        await anyio.to_thread.run_sync(_sync, fd)
+    finally:
+        os.close(fd)
+
+    if length == 0:
+        raise ValueError("Empty chunk")
+    if digest and digest.digest() != checksum[1]:
+        raise ChecksumMismatch("Chunk checksum mismatch")
+
+    marker = os.path.join(session_dir, f"{offset}-{length}")
+    try:
+        open(marker, "w").close()
+    except FileNotFoundError:
+        raise LookupError("Unknown upload")
+    return length
+
+
+def _received_ranges(upload_id):
+    ranges = []
+    for name in os.listdir(_session_dir(upload_id)):
+        start, sep, length = name.partition("-")
+        if sep and start.isdigit() and length.isdigit():
+            ranges.append((int(start), int(start) + int(length)))
+    ranges.sort()
+
+    merged = []
+    for start, end in ranges:
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def session_status(upload_id):
+    """Report received ranges, the contiguous offset and what is missing"""
+    session = _load_session(upload_id)
+    received = _received_ranges(upload_id)
+
+    missing = []
+    cursor = 0
+    for start, end in received:
+        if start > cursor:
+            missing.append([cursor, start])
+        cursor = max(cursor, end)
+    if cursor < session["size"]:
+        missing.append([cursor, session["size"]])
+
+    contiguous = received[0][1] if received and received[0][0] == 0 else 0
+    return {
+        "upload_id": upload_id,
+        "size": session["size"],
+        "offset": contiguous,
+        "received": [list(r) for r in received],
+        "missing": missing,
+        "complete": not missing
+    }
+
+
+def finalize(upload_id, checksum=None):
+    """Verify every byte arrived and move the part file into place as an asset"""
+    session = _load_session(upload_id)
+    status = session_status(upload_id)
+    if not status["complete"]:
+        raise ValueError(f"Upload incomplete, missing ranges: {status['missing']}")
+
+    if checksum:
+        digest = hashlib.new(checksum[0])
+        with open(session["part_path"], "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(block)
+        if digest.digest() != checksum[1]:
+            raise ChecksumMismatch("File checksum mismatch")
+
+    asset_path = os.path.join(INPUT_DIR, session["asset"])
+    os.replace(session["part_path"], asset_path)
+    shutil.rmtree(_session_dir(upload_id), ignore_errors=True)
+    return {"asset": session["asset"], "path": asset_path, "size": session["size"]}
@@ -0,0 +1,144 @@
+"""
+Worker node for the shared job queue.
+
+Run one or more of these on any machine that can see the job store and the
+shared INPUT_DIR/OUTPUT_DIR:
+
+    python worker.py --processes 4
+"""
+import argparse
+import multiprocessing
+import os
+import socket
+import threading
+import time
+import uuid
+
+import encoder_tuning
+import workspace
+from config import JOB_LEASE_SECONDS, WORKER_POLL_INTERVAL, ENCODER_TUNING_ENABLED
+from ffmpeg_utils import FFMPEG_BIN
+from job_queue import get_job_queue
+from processor import run_edit_job
+from workspace import JobCancelled
+
+
+def _heartbeat_loop(queue, job_id, worker_id, stop_event, lease_lost):
+    # Renew well before expiry so a slow store round-trip cannot lose the lease
+    interval = max(1.0, JOB_LEASE_SECONDS / 3)
+    last_renewed = time.monotonic()
+    while not stop_event.wait(interval):
+        try:
+            renewed = queue.heartbeat(job_id, worker_id)
+        except Exception as e:
+            # e.g. "database is locked" on shared storage; keep trying until
+            # the lease could have expired, then assume another worker has it
+            print(f"⚠️  Heartbeat for job {job_id} failed: {e}")
+            if time.monotonic() - last_renewed < JOB_LEASE_SECONDS:
+                continue
+            renewed = False
+        if not renewed:
+            print(f"⚠️  Worker {worker_id} lost lease on job {job_id}")
+            lease_lost.set()
+            return
+        last_renewed = time.monotonic()
+
+
+def run_worker(worker_id=None, once=False):
+    """Claim and process jobs until interrupted (or the queue is empty if once)"""
+    if ENCODER_TUNING_ENABLED:
+        # Workers render straight away, so wait for (usually cached) tuning
+        encoder_tuning.calibrate(FFMPEG_BIN)
+
+    queue = get_job_queue()
+    worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+    print(f"👷 Worker {worker_id} started")
+
+    while True:
+        job = queue.claim(worker_id)
+        if job is None:
+            if once:
+                return
+            time.sleep(WORKER_POLL_INTERVAL)
+            continue
+
+        print(f"Processing job {job['id']} (attempt {job['attempts']})")
+        stop_event = threading.Event()
+        lease_lost = threading.Event()
+        heartbeat = threading.Thread(
+            target=_heartbeat_loop,
+            args=(queue, job["id"], worker_id, stop_event, lease_lost),
+            daemon=True)
+        heartbeat.start()
+
+        try:
+            payload = job["payload"]
+            result = run_edit_job(
+                payload["input_path"], payload["actions"], payload["output_path"],
+                output_format=payload.get("output_format", "mp4"),
+                stream_id=payload.get("stream_id"),
+                profile=payload.get("profile", False),
+                upload_wall_s=payload.get("upload_wall_s"),
+                cancel=lease_lost)
+        except JobCancelled:
+            # Another worker holds the job now; leave its outputs alone
+            print(f"⚠️  Abandoned job {job['id']} after losing its lease")
+            stop_event.set()
+            heartbeat.join()
+            continue
+        except Exception as e:
+            print(f"Job {job['id']} failed: {e}")
+            stop_event.set()
+            heartbeat.join()
+            queue.fail(job["id"], worker_id, e)
+            continue
+
+        stop_event.set()
+        heartbeat.join()
+        if lease_lost.is_set() or not queue.complete(job["id"], worker_id, result):
+            print(f"⚠️  Job {job['id']} was reassigned before completion")
+        else:
+            print(f"✅ Job {job['id']} completed")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="VideoSure engine worker")
+    parser.add_argument("--processes", type=int, default=1,
+                        help="Number of worker processes to start on this node")
+    parser.add_argument("--once", action="store_true",
+                        help="Exit when the queue is empty instead of polling")
+    parser.add_argument("--calibrate", action="store_true",
+                        help="Re-run encoder calibration for this host and exit")
+    args = parser.parse_args()
+
+    if args.calibrate:
+        encoder_tuning.calibrate(FFMPEG_BIN, force=True)
+        return
+
+    if ENCODER_TUNING_ENABLED:
+        # Calibrate once up front so worker processes don't benchmark concurrently
+        encoder_tuning.calibrate(FFMPEG_BIN)
+
+    # Recover or remove workspaces of jobs that died with a previous worker
+    workspace.sweep_orphans()
+
+    if args.processes <= 1:
+        run_worker(once=args.once)
+        return
+
+    workers = [
+        multiprocessing.Process(target=run_worker, kwargs={"once": args.once})
+        for _ in range(args.processes)
+    ]
+    for process in workers:
+        process.start()
+    try:
+        for process in workers:
+            process.join()
+    except KeyboardInterrupt:
+        for process in workers:
+            process.terminate()
+
+
+if __name__ == "__main__":
+    main()
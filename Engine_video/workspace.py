@@ -0,0 +1,261 @@
+"""
+Per-job workspaces and crash recovery.
+
+Every job renders inside its own directory under WORK_DIR, so intermediates
+of concurrent jobs can never collide, and finished files are published to
+their final location with an atomic rename - readers see either the old file
+or the complete new one. Each workspace records its owner; sweep_orphans()
+removes workspaces whose owner died, publishing any render that finished but
+was never moved into place. Completed steps are already in the render cache,
+so a retried job resumes from the last finished step.
+"""
+import contextvars
+import errno
+import json
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import time
+import uuid
+from pathlib import Path
+
+from config import WORK_DIR, WORKSPACE_STALE_SECONDS
+
+
+_OWNER_FILE = "owner.json"
+_DONE_SUFFIX = ".done"
+
+_current_workspace = contextvars.ContextVar("current_workspace", default=None)
+_active = set()  # Workspace dirs owned by this process
+_active_lock = threading.Lock()
+
+
+class JobCancelled(Exception):
+    """Raised when a job must stop without publishing (e.g. its lease was lost)"""
+
+
+def _process_start(pid):
+    """Start time of a process in clock ticks since boot (Linux), else None"""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            # Fields after the parenthesized command name; starttime is field 22
+            return int(f.read().rsplit(")", 1)[1].split()[19])
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def current_workspace():
+    return _current_workspace.get()
+
+
+def scratch_dir(fallback):
+    """Directory for temporary files: the current workspace, else ``fallback``"""
+    workspace = current_workspace()
+    return str(workspace.path) if workspace else str(fallback)
+
+
+def _publish(source, destination):
+    """Atomically move ``source`` to ``destination``, copying across filesystems"""
+    destination = Path(destination)
+    destination.parent.mkdir(parents=True, exist_ok=True)
+    if Path(source).is_dir():
+        return _publish_dir(source, destination)
+
+    try:
+        os.replace(source, destination)
+        return str(destination)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+
+    # Cross-device: copy next to the destination, then rename over it
+    fd, temp_path = tempfile.mkstemp(prefix=f".{destination.name}.",
+                                     dir=destination.parent)
+    os.close(fd)
+    try:
+        shutil.copyfile(source, temp_path)
+        os.replace(temp_path, destination)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+    os.remove(source)
+    return str(destination)
+
+
+def _publish_dir(source, destination):
+    # A directory cannot be renamed over a non-empty one, so move the old
+    # copy aside first; it is only missing for the instant between renames
+    previous = None
+    if destination.exists():
+        previous = destination.with_name(f".{destination.name}.{uuid.uuid4().hex[:8]}.old")
+        os.replace(destination, previous)
+    try:
+        os.replace(source, destination)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        shutil.move(str(source), str(destination))
+    if previous:
+        shutil.rmtree(previous, ignore_errors=True)
+    return str(destination)
+
+
+class JobWorkspace:
+    """
+    Scratch directory for one job.
+
+    Entering it makes it the current workspace for this context (nested
+    entries reuse the outer one); leaving it removes the directory. Once the
+    optional ``cancel`` event is set, nothing more is published from it.
+    """
+
+    def __init__(self, label="job", cancel=None):
+        self.label = label
+        self.cancel = cancel
+        self.path = None
+        self._token = None
+        self._nested = False
+
+    def __enter__(self):
+        outer = current_workspace()
+        if outer is not None:
+            self._nested = True
+            self.path = outer.path
+            return outer
+
+        Path(WORK_DIR).mkdir(parents=True, exist_ok=True)
+        self.path = Path(WORK_DIR) / f"{uuid.uuid4().hex[:12]}_{self.label}"
+        self.path.mkdir()
+        with open(self.path / _OWNER_FILE, "w") as f:
+            json.dump({"host": socket.gethostname(), "pid": os.getpid(),
+                       "pid_start": _process_start(os.getpid()),
+                       "created_at": time.time(), "outputs": {}}, f)
+        with _active_lock:
+            _active.add(str(self.path))
+        self._token = _current_workspace.set(self)
+        return self
+
+    def __exit__(self, *exc):
+        if self._nested:
+            return False
+        _current_workspace.reset(self._token)
+        shutil.rmtree(self.path, ignore_errors=True)
+        with _active_lock:
+            _active.discard(str(self.path))
+        return False
+
+    def check_cancelled(self):
+        if self.cancel is not None and self.cancel.is_set():
+            raise JobCancelled("Job cancelled before completion")
+
+    def file(self, name):
+        """Unique path for an intermediate file inside the workspace"""
+        stem, suffix = os.path.splitext(name)
+        return str(self.path / f"{stem}_{uuid.uuid4().hex[:8]}{suffix}")
+
+    def _record_output(self, name, destination):
+        owner_path = self.path / _OWNER_FILE
+        with open(owner_path) as f:
+            owner = json.load(f)
+        owner["outputs"][name] = str(destination)
+        temp_path = f"{owner_path}.tmp"
+        with open(temp_path, "w") as f:
+            json.dump(owner, f)
+        os.replace(temp_path, owner_path)
+
+    def publish(self, source, destination):
+        """
+        Move a finished render to its final path.
+
+        Files outside the workspace (e.g. a cached render) are copied into
+        it first so the final step is always a rename. The destination is
+        recorded before the move, so a crash in between can be recovered.
+        """
+        self.check_cancelled()
+        source = Path(source)
+        if self.path not in source.parents:
+            copy_path = Path(self.file(f"publish{source.suffix}"))
+            shutil.copyfile(source, copy_path)
+            source = copy_path
+
+        done_path = source.with_name(source.name + _DONE_SUFFIX)
+        os.replace(source, done_path)
+        self._record_output(done_path.name, destination)
+        return _publish(done_path, destination)
+
+
+def _owner_alive(owner, workspace_dir):
+    if owner.get("host") != socket.gethostname():
+        return None  # Unknown - decided by age
+    pid = owner.get("pid")
+    if pid == os.getpid():
+        with _active_lock:
+            return workspace_dir in _active
+    if os.name == "nt":
+        return None  # os.kill would terminate the process on Windows
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except (PermissionError, TypeError):
+        return None
+    # The pid may have been reused (e.g. after a container restart)
+    recorded = owner.get("pid_start")
+    if recorded is not None and _process_start(pid) != recorded:
+        return False
+    return True
+
+
+def sweep_orphans():
+    """
+    Recover or remove workspaces left behind by crashed jobs.
+
+    A workspace is orphaned when its owner process on this host is gone
+    (matched by pid and process start time, so reused pids do not count), or
+    when it is older than WORKSPACE_STALE_SECONDS whoever owns it. Renders
+    that were finished but not yet published are moved into place first.
+    Returns (removed, recovered) counts.
+    """
+    removed = recovered = 0
+    try:
+        entries = list(os.scandir(WORK_DIR))
+    except FileNotFoundError:
+        return removed, recovered
+
+    now = time.time()
+    for entry in entries:
+        if not entry.is_dir():
+            continue
+        try:
+            with open(os.path.join(entry.path, _OWNER_FILE)) as f:
+                owner = json.load(f)
+        except (OSError, ValueError):
+            owner = {}
+
+        alive = _owner_alive(owner, entry.path) if owner else None
+        if alive and owner.get("pid") == os.getpid():
+            continue  # One of our own running jobs
+        # Age caps even an apparently live owner, in case its pid was reused
+        started = owner.get("created_at") or entry.stat().st_mtime
+        expired = now - started >= WORKSPACE_STALE_SECONDS
+        if alive is not False and not expired:
+            continue
+
+        for name, destination in owner.get("outputs", {}).items():
+            done_path = os.path.join(entry.path, name)
+            if os.path.exists(done_path):
+                try:
+                    _publish(done_path, destination)
+                    recovered += 1
+                    print(f"♻️  Recovered finished render {destination}")
+                except OSError as e:
+                    print(f"⚠️  Could not recover {destination}: {e}")
+
+        shutil.rmtree(entry.path, ignore_errors=True)
+        removed += 1
+
+    if removed:
+        print(f"🧹 Removed {removed} orphaned job workspace(s)")
+    return removed, recovered
@@ -20,6 +20,7 @@ AVAILABLE ACTIONS:
 1. BASIC EDITS:
    - trim: Cut video to specific duration (value: seconds to keep from start)
    - cut_section: Remove a section from middle (start_time, end_time in seconds)
+   - cut_ranges: Remove several sections in one pass (ranges: list of {start_time, end_time} in seconds)
    - adjust_contrast: Adjust contrast (-100 to 100)
    - brightness: Adjust brightness (-100 to 100)
    - saturation: Adjust color saturation (-100 to 100)
@@ -48,6 +49,7 @@ INTELLIGENT SUGGESTIONS:
 - If user says "remove shaky": Apply slight blur+2
 - If user mentions specific tools, use those exact tools
 - If user wants to "cut out" or "remove" a section, use cut_section with start_time and end_time
+- If user wants to remove more than one section, use a single cut_ranges action instead of several cut_section actions
 
 OUTPUT FORMAT (must be valid JSON):
 {
@@ -98,6 +100,7 @@ AVAILABLE ACTIONS WITH EXAMPLES:
 3. EDITING:
    - trim: seconds to keep from start (e.g., 30 = keep first 30 seconds)
    - cut_section: {start_time: X, end_time: Y} removes middle section
+   - cut_ranges: {ranges: [{start_time: X, end_time: Y}, ...]} removes several sections in one pass
    - speed: 0.1-4.0 (0.5=half speed, 2.0=double speed)
 
 4. AUDIO:
@@ -115,7 +118,7 @@ SMART PRESETS:
 - "fix dark video" → brightness+30, gamma+15
 - "enhance colors" → saturation+25, contrast+10
 - "social media ready" → scale to 1080x1080, brightness+5, contrast+8
-- "remove boring parts" → suggest cut_section for likely unwanted segments
+- "remove boring parts" → suggest one cut_ranges action covering likely unwanted segments
 
 RESPONSE FORMAT (must be valid JSON):
 {